@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+from itertools import groupby
+from operator import add, mul
+
+
+# Accumulate function name: (combine, identity, lift, finalize)
+#   * combine: associative operation joining two accumulated values
+#   * identity: accumulated value of an empty window
+#   * lift: converts a price into an accumulated value
+#   * finalize: converts an accumulated value back into a price
+OPERATIONS = {
+    'sum': (add, 0.0, float, float),
+    'interest': (mul, 1.0,
+                 lambda price: 1 + float(price) / 100,
+                 lambda product: (product - 1) * 100),
+}
+
+
+def window_sizes(amount):
+    '''
+    Normalize an accumulate amount.
+    @param amount: An integer or a sequence of integers.
+    @return: A tuple with the window sizes, without repetitions.
+    '''
+    if isinstance(amount, (int, long)):
+        return (amount,)
+    return tuple(sorted(set(amount)))
+
+
+def accumulated_symbol(symbol, size):
+    '''
+    @return: The symbol of the prices of a symbol accumulated over windows
+             of a size ("symbol-ACx", where 'x' is the size).
+    '''
+    return '{0}-AC{1}'.format(symbol, size)
+
+
+class RollingWindow(object):
+    '''
+    Sliding window over the last "size" values, keeping the accumulated
+    value of the window in amortized O(1) time per value.
+
+    The window is kept in two stacks: values are pushed onto the back
+    stack, which keeps a running accumulated value, and removed from the
+    front stack, which keeps the accumulated value of each value with all
+    values after it.  When the front stack is empty, the back stack is
+    moved into it.  As only the combine operation is used (never its
+    inverse), there is no precision loss along long histories and zero
+    values are handled correctly.
+    '''
+
+    __slots__ = ('size', 'combine', 'identity', '__front', '__back',
+                 '__back_acc')
+
+    def __init__(self, size, combine, identity):
+        '''
+        Constructor
+        @param size: Number of values in the window.
+        @param combine: Associative function joining two accumulated values.
+        @param identity: Accumulated value of an empty window.
+        '''
+        self.size = size
+        self.combine = combine
+        self.identity = identity
+
+        self.__front = list()  # (value, accumulated value from it onward)
+        self.__back = list()
+        self.__back_acc = identity
+
+    def __len__(self):
+        return len(self.__front) + len(self.__back)
+
+    def push(self, value):
+        '''
+        Push a value into the window, dropping the oldest value if the
+        window is full.
+        @param value: The (already lifted) value.
+        @return: The accumulated value of the window or None if the window
+                 is not full yet.
+        '''
+        self.__back.append(value)
+        self.__back_acc = self.combine(self.__back_acc, value)
+
+        if len(self) > self.size:
+            if not self.__front:
+                acc = self.identity
+                for item in reversed(self.__back):
+                    acc = self.combine(item, acc)
+                    self.__front.append((item, acc))
+                self.__back = list()
+                self.__back_acc = self.identity
+            self.__front.pop()
+
+        if len(self) < self.size:
+            return None
+
+        if self.__front:
+            return self.combine(self.__front[-1][1], self.__back_acc)
+        return self.__back_acc
+
+    def values(self):
+        '''
+        @return: A list with the values in the window, oldest first.
+        '''
+        return [value for value, _ in reversed(self.__front)] + self.__back
+
+
+def accumulate(data, amount, function, state=None):
+    '''
+    Accumulate prices over sliding windows in a single pass.
+    @param data: Iterable of tuples "symbol, date, price", sorted by symbol
+                 and date.  Items with price None are ignored.
+    @param amount: Number of items in the window or a sequence of numbers
+                   to accumulate several windows at once.
+    @param function: Name of the accumulate function (see OPERATIONS).
+    @param state: Dictionary "symbol-ACx: (last date, window values)"
+                  with the windows left by a previous call, updated in
+                  place.  Windows found in it are resumed: items not newer
+                  than their last date are ignored, so only new
+                  accumulated prices are produced.
+    @return: A generator of tuples "symbol-ACx, date, accumulated price",
+             where 'x' is the window size.  Items are sorted by their
+             (accumulated) symbol, as strings, and date, and the date of
+             an item is the date of the last item of its window.  Windows
+             never cross symbols.  Items of the first accumulated symbol
+             are produced as data is read; items of the others (with
+             several window sizes) are kept until all the data of their
+             symbol is read.
+    @raise Exception: if the accumulate function is unknown.
+    '''
+    if function not in OPERATIONS:
+        msg = "Unknown accumulate function named '{0}'."
+        raise Exception(msg.format(function))
+
+    combine, identity, lift, finalize = OPERATIONS[function]
+    # Sizes in the order of their accumulated symbols ('AC12' < 'AC3')
+    sizes = sorted(window_sizes(amount), key=str)
+    if state is None:
+        state = dict()
+
+    for symbol, items in groupby(data, lambda item: item[0]):
+        acc_symbols = [accumulated_symbol(symbol, size) for size in sizes]
+        windows = [RollingWindow(size, combine, identity) for size in sizes]
+        last_dates = [None] * len(sizes)
+        results = [list() for _ in sizes]
+
+        for i, acc_symbol in enumerate(acc_symbols):
+            if acc_symbol in state:
+                last_dates[i], values = state[acc_symbol]
+                for value in values:
+                    windows[i].push(value)
+
+        for _, qdate, price in items:
+            if price is None:
+                continue
+
+            value = lift(price)
+            for i, window in enumerate(windows):
+                if last_dates[i] is not None and qdate <= last_dates[i]:
+                    continue
+
+                last_dates[i] = qdate
+                acc = window.push(value)
+                if acc is None:
+                    continue
+
+                if i == 0:
+                    yield acc_symbols[i], qdate, finalize(acc)
+                else:
+                    results[i].append((qdate, finalize(acc)))
+
+        for acc_symbol, window, last_date, result in \
+                zip(acc_symbols, windows, last_dates, results):
+            if last_date is not None:
+                state[acc_symbol] = (last_date, window.values())
+
+            for qdate, acc_price in result:
+                yield acc_symbol, qdate, acc_price
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+from csv import writer as csvwriter
+from heapq import merge
+from os import makedirs
+from os.path import exists, join
+
+from instrumentation import NULL_STAGE
+from quickencsv import load_index, load_state, save_index, save_state, \
+    skip_exported, track_exported
+
+
+class BatchExporter(object):
+    '''
+    Export several QuickenCSV jobs at once, to a combined CSV file and
+    (optionally) to one CSV file per symbol.
+
+    The rows of all jobs are merged into a single stream sorted by symbol
+    and date, written once to the combined file and to the file of its
+    symbol.  Files are opened once per export with large buffers, and the
+    file of a symbol is only open while its rows are written.  A symbol
+    exported by more than one job is written only once.
+
+    The combined file keeps the same index and accumulation state files as
+    QuickenCSV.export_to_file, so both can be used on the same file.  The
+    files per symbol get exactly the rows written to the combined file.
+
+    Usage:
+        exporter = BatchExporter([qcsv1, qcsv2], 'symbols')
+        exporter.export_to_file('quotes.csv', clear_file=False,
+                                only_new=True)
+
+    If "instrument" is set (see instrumentation.Instrument), exporting is
+    measured, labeled by "name".
+    '''
+
+    BUFFER_SIZE = 64 * 1024
+
+    instrument = None
+
+    def __init__(self, jobs, symbols_dir=None, name=None):
+        '''
+        Constructor
+        @param jobs: List of QuickenCSV objects.
+        @param symbols_dir: Directory of the files per symbol (named as
+                            "<symbol>.csv").  If None, only the combined
+                            file is written.
+        @param name: Name of the object in measures.
+        '''
+        self.field_delimiter = ','
+        self.quote_char = '"'
+        self.date_format = '%x'  # use system locale
+
+        self.jobs = list(jobs)
+        self.symbols_dir = symbols_dir
+        self.name = name or self.__class__.__name__
+
+    def export_to_file(self, target_file, clear_file=True, only_new=False):
+        '''
+        Export the values of all jobs.
+        @param target_file: Name of the combined file.
+        @param clear_file: If False, the values are appended to the files.
+        @param only_new: If True, only rows whose symbol and date are not
+                         in the combined file yet are appended.
+        @return: Number of lines written to the combined file.
+        @see: QuickenCSV.export_to_file
+        '''
+        index_file = target_file + '.idx'
+        state_file = target_file + '.acc'
+
+        resume = not clear_file and exists(target_file)
+        exported = load_index(index_file) if resume else dict()
+
+        state = load_state(state_file)
+        if not (resume and only_new):
+            # Accumulate from scratch
+            for job in self.jobs:
+                state.pop(job.name, None)
+
+        if self.symbols_dir is not None and not exists(self.symbols_dir):
+            makedirs(self.symbols_dir)
+
+        mode = 'wb' if clear_file else 'ab'
+
+        # The rows of all jobs are merged before being skipped or tracked,
+        # since jobs may share symbols
+        streams = [job.rows(None, state=state)
+                   for job in self.jobs if len(job.values) > 0]
+        rows = self.__unique(merge(*streams))
+        if only_new:
+            rows = skip_exported(rows, exported)
+        else:
+            rows = track_exported(rows, exported)
+
+        with self.__instrumented('export') as record, \
+                open(target_file, mode, self.BUFFER_SIZE) as f:
+            csvfile = csvwriter(f, delimiter=self.field_delimiter,
+                                quotechar=self.quote_char)
+
+            symbol_file = None
+            symbol_csv = None
+            current = None  # symbol of the open file
+            opened = set()
+            formatted = dict()
+
+            lines = 0
+            offset = f.tell()
+            try:
+                for symbol, qdate, price in rows:
+                    str_date = formatted.get(qdate)
+                    if str_date is None:
+                        str_date = formatted[qdate] = \
+                            qdate.strftime(self.date_format)
+
+                    row = (symbol, str_date, price)
+                    csvfile.writerow(row)
+                    lines += 1
+
+                    if self.symbols_dir is None:
+                        continue
+
+                    if symbol != current:
+                        if symbol_file is not None:
+                            symbol_file.close()
+                        symbol_file = open(
+                            join(self.symbols_dir, symbol + '.csv'),
+                            'ab' if symbol in opened else mode,
+                            self.BUFFER_SIZE)
+                        symbol_csv = csvwriter(
+                            symbol_file, delimiter=self.field_delimiter,
+                            quotechar=self.quote_char)
+                        current = symbol
+                        opened.add(symbol)
+
+                    symbol_csv.writerow(row)
+            finally:
+                if symbol_file is not None:
+                    symbol_file.close()
+
+            record.rows = lines
+            record.bytes = f.tell() - offset
+
+        save_index(index_file, exported)
+        if state or exists(state_file):
+            save_state(state_file, state)
+
+        return lines
+
+    @staticmethod
+    def __unique(rows):
+        '''
+        Skip the rows repeating the symbol and date of the previous row.
+        @param rows: Iterable of tuples "symbol, date, price" sorted by
+                     symbol and date.
+        @return: A generator with the unique rows.
+        '''
+        previous = None
+        for symbol, qdate, price in rows:
+            if (symbol, qdate) != previous:
+                previous = symbol, qdate
+
+                yield symbol, qdate, price
+
+    def __instrumented(self, stage, **counts):
+        '''
+        Measure a stage (see Quote.instrumented).
+        '''
+        if self.instrument is None:
+            return NULL_STAGE
+        return self.instrument.stage(self.name, stage, **counts)
+
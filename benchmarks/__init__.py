@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+'''
+Offline benchmarks.  Run each module from the project root, e.g.:
+    python -m benchmarks.pipeline
+'''
+
+from timeit import default_timer
+
+
+def measure(func, *args, **options):
+    '''
+    Time a function.
+    @param repeat: Number of runs (default 3).
+    @return: The best time of all runs, in seconds.
+    '''
+    best = None
+    for _ in range(options.get('repeat', 3)):
+        start = default_timer()
+        func(*args)
+        elapsed = default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
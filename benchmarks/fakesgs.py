@@ -0,0 +1,599 @@
+# -*- coding: utf-8 -*-
+'''
+Local stand-in for the SGS web service (FachadaWSSGS), for load and
+latency tests of the real SOAP code path without the Central Bank.
+
+The server publishes a WSDL with the same operations, types and encoding
+(RPC/encoded) of the real service and answers getValoresSeriesVO,
+getValoresSeriesXML, getUltimoValorVO, getUltimoValorXML, getValor and
+getValorEspecial with generated data: monthly series (see MONTHLY) have a
+value on the first day of each month up to the previous month, all other
+series have a value on each business day up to yesterday.  Values are
+deterministic for each series and date.
+
+Each call can be slowed down (latency plus random jitter), fail with a
+SOAP fault (fault rate) or be rejected when over a rate limit.
+
+Usage as a program:
+    python -m benchmarks.fakesgs [--port N] [--latency S] [--jitter S]
+                                 [--fault-rate P] [--rate-limit N]
+
+then point SGS to it:
+    SGS.WSDL_URL = 'http://127.0.0.1:N/FachadaWSSGS.wsdl'
+
+Usage from Python:
+    server = FakeSGSServer(latency=0.2)
+    server.start()
+    SGS.WSDL_URL = server.wsdl_url
+    ...
+    server.stop()
+'''
+
+from __future__ import print_function
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from argparse import ArgumentParser
+from datetime import date, timedelta
+from random import Random
+from threading import Lock, Thread
+from time import sleep, time
+from xml.etree.cElementTree import fromstring
+from xml.sax.saxutils import escape
+
+
+NS = 'http://publico.ws.casosdeuso.sgs.pec.bcb.gov.br'
+NS_TYPES = 'http://comum.ws.casosdeuso.sgs.pec.bcb.gov.br'
+
+MONTHLY = frozenset([188, 189, 193, 433])
+
+WSDL = '''<?xml version="1.0" encoding="UTF-8"?>
+<wsdl:definitions targetNamespace="{ns}"
+    xmlns:impl="{ns}" xmlns:tns1="{ns_types}"
+    xmlns:soapenc="http://schemas.xmlsoap.org/soap/encoding/"
+    xmlns:wsdl="http://schemas.xmlsoap.org/wsdl/"
+    xmlns:wsdlsoap="http://schemas.xmlsoap.org/wsdl/soap/"
+    xmlns:xsd="http://www.w3.org/2001/XMLSchema">
+ <wsdl:types>
+  <schema targetNamespace="{ns_types}"
+      xmlns="http://www.w3.org/2001/XMLSchema">
+   <import namespace="http://schemas.xmlsoap.org/soap/encoding/"/>
+   <complexType name="WSValorSerieVO">
+    <sequence>
+     <element name="ano" type="xsd:int"/>
+     <element name="anoFim" type="xsd:int"/>
+     <element name="bloqueado" type="xsd:boolean"/>
+     <element name="bloqueioLiberado" type="xsd:boolean"/>
+     <element name="dia" type="xsd:int"/>
+     <element name="diaFim" type="xsd:int"/>
+     <element name="mes" type="xsd:int"/>
+     <element name="mesFim" type="xsd:int"/>
+     <element name="oid" type="xsd:long"/>
+     <element name="oidSerie" type="xsd:long"/>
+     <element name="svalor" nillable="true" type="soapenc:string"/>
+     <element name="valor" nillable="true" type="xsd:decimal"/>
+    </sequence>
+   </complexType>
+   <complexType name="WSSerieVO">
+    <sequence>
+     <element name="anoFim" type="xsd:int"/>
+     <element name="anoInicio" type="xsd:int"/>
+     <element name="aviso" nillable="true" type="soapenc:string"/>
+     <element name="diaFim" type="xsd:int"/>
+     <element name="diaInicio" type="xsd:int"/>
+     <element name="especial" type="xsd:boolean"/>
+     <element name="fonte" nillable="true" type="soapenc:string"/>
+     <element name="fullName" nillable="true" type="soapenc:string"/>
+     <element name="mesFim" type="xsd:int"/>
+     <element name="mesInicio" type="xsd:int"/>
+     <element name="nomeAbreviado" nillable="true" type="soapenc:string"/>
+     <element name="nomeCompleto" nillable="true" type="soapenc:string"/>
+     <element name="oid" type="xsd:long"/>
+     <element name="periodicidade" nillable="true" type="soapenc:string"/>
+     <element name="periodicidadeSigla" nillable="true"
+         type="soapenc:string"/>
+     <element name="possuiBloqueios" type="xsd:boolean"/>
+     <element name="publica" type="xsd:boolean"/>
+     <element name="shortName" nillable="true" type="soapenc:string"/>
+     <element name="ultimoValor" nillable="true" type="tns1:WSValorSerieVO"/>
+     <element name="unidadePadrao" nillable="true" type="soapenc:string"/>
+     <element name="valorDiaNaoUtil" type="xsd:boolean"/>
+     <element name="valores" nillable="true"
+         type="impl:ArrayOf_tns1_WSValorSerieVO"/>
+    </sequence>
+   </complexType>
+  </schema>
+  <schema targetNamespace="{ns}" xmlns="http://www.w3.org/2001/XMLSchema">
+   <import namespace="http://schemas.xmlsoap.org/soap/encoding/"/>
+   <import namespace="{ns_types}"/>
+   <complexType name="ArrayOf_xsd_long">
+    <complexContent>
+     <restriction base="soapenc:Array">
+      <attribute ref="soapenc:arrayType" wsdl:arrayType="xsd:long[]"/>
+     </restriction>
+    </complexContent>
+   </complexType>
+   <complexType name="ArrayOf_tns1_WSValorSerieVO">
+    <complexContent>
+     <restriction base="soapenc:Array">
+      <attribute ref="soapenc:arrayType"
+          wsdl:arrayType="tns1:WSValorSerieVO[]"/>
+     </restriction>
+    </complexContent>
+   </complexType>
+   <complexType name="ArrayOf_tns1_WSSerieVO">
+    <complexContent>
+     <restriction base="soapenc:Array">
+      <attribute ref="soapenc:arrayType" wsdl:arrayType="tns1:WSSerieVO[]"/>
+     </restriction>
+    </complexContent>
+   </complexType>
+  </schema>
+ </wsdl:types>
+{messages}
+ <wsdl:portType name="FachadaWSSGS">
+{port_operations}
+ </wsdl:portType>
+ <wsdl:binding name="FachadaWSSGSSoapBinding" type="impl:FachadaWSSGS">
+  <wsdlsoap:binding style="rpc"
+      transport="http://schemas.xmlsoap.org/soap/http"/>
+{binding_operations}
+ </wsdl:binding>
+ <wsdl:service name="FachadaWSSGSService">
+  <wsdl:port binding="impl:FachadaWSSGSSoapBinding" name="FachadaWSSGS">
+   <wsdlsoap:address location="{location}"/>
+  </wsdl:port>
+ </wsdl:service>
+</wsdl:definitions>
+'''
+
+# Operation: (parameter types, return type)
+OPERATIONS = {
+    'getValoresSeriesVO': (['impl:ArrayOf_xsd_long', 'soapenc:string',
+                            'soapenc:string'], 'impl:ArrayOf_tns1_WSSerieVO'),
+    'getValoresSeriesXML': (['impl:ArrayOf_xsd_long', 'soapenc:string',
+                             'soapenc:string'], 'soapenc:string'),
+    'getUltimoValorVO': (['xsd:long'], 'tns1:WSSerieVO'),
+    'getUltimoValorXML': (['xsd:long'], 'soapenc:string'),
+    'getValor': (['xsd:long', 'soapenc:string'], 'xsd:decimal'),
+    'getValorEspecial': (['xsd:long', 'soapenc:string', 'soapenc:string'],
+                         'xsd:decimal'),
+}
+
+ENVELOPE = '<?xml version="1.0" encoding="UTF-8"?>' \
+    '<soapenv:Envelope' \
+    ' xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"' \
+    ' xmlns:soapenc="http://schemas.xmlsoap.org/soap/encoding/"' \
+    ' xmlns:xsd="http://www.w3.org/2001/XMLSchema"' \
+    ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"' \
+    ' xmlns:ns1="' + NS + '" xmlns:ns2="' + NS_TYPES + '">' \
+    '<soapenv:Body>{0}</soapenv:Body></soapenv:Envelope>'
+
+FAULT = '<soapenv:Fault><faultcode>soapenv:Server</faultcode>' \
+    '<faultstring>{0}</faultstring></soapenv:Fault>'
+
+
+def build_wsdl(location):
+    '''
+    @param location: URL of the SOAP endpoint.
+    @return: The WSDL of the service.
+    '''
+    messages = list()
+    port_operations = list()
+    binding_operations = list()
+    body = '<wsdlsoap:body encodingStyle=' \
+        '"http://schemas.xmlsoap.org/soap/encoding/" namespace="{0}"' \
+        ' use="encoded"/>'.format(NS)
+
+    for operation in sorted(OPERATIONS):
+        parameters, return_type = OPERATIONS[operation]
+        parts = ''.join('<wsdl:part name="in{0}" type="{1}"/>'
+                        .format(index, parameter)
+                        for index, parameter in enumerate(parameters))
+        messages.append(
+            ' <wsdl:message name="{0}Request">{1}</wsdl:message>\n'
+            ' <wsdl:message name="{0}Response"><wsdl:part name="{0}Return"'
+            ' type="{2}"/></wsdl:message>'
+            .format(operation, parts, return_type))
+        port_operations.append(
+            '  <wsdl:operation name="{0}">'
+            '<wsdl:input message="impl:{0}Request"/>'
+            '<wsdl:output message="impl:{0}Response"/>'
+            '</wsdl:operation>'.format(operation))
+        binding_operations.append(
+            '  <wsdl:operation name="{0}">'
+            '<wsdlsoap:operation soapAction=""/>'
+            '<wsdl:input>{1}</wsdl:input>'
+            '<wsdl:output>{1}</wsdl:output>'
+            '</wsdl:operation>'.format(operation, body))
+
+    return WSDL.format(ns=NS, ns_types=NS_TYPES, location=location,
+                       messages='\n'.join(messages),
+                       port_operations='\n'.join(port_operations),
+                       binding_operations='\n'.join(binding_operations))
+
+
+class SeriesGenerator(object):
+    '''
+    Deterministic data of the fake series.
+    '''
+
+    def __init__(self, monthly=MONTHLY):
+        self.monthly = monthly
+
+    def periodicity(self, serie):
+        return 'M' if serie in self.monthly else 'D'
+
+    def dates(self, serie, initial_date, final_date):
+        '''
+        @return: A list with the dates with values in an interval.
+        '''
+        final_date = min(final_date, self.last_date(serie))
+        if serie in self.monthly:
+            qdate = date(initial_date.year, initial_date.month, 1)
+            if qdate < initial_date:
+                qdate = self.__next_month(qdate)
+            dates = list()
+            while qdate <= final_date:
+                dates.append(qdate)
+                qdate = self.__next_month(qdate)
+            return dates
+
+        return [initial_date + timedelta(days=days)
+                for days in range((final_date - initial_date).days + 1)
+                if (initial_date + timedelta(days=days)).weekday() < 5]
+
+    def last_date(self, serie):
+        '''
+        @return: The date of the last value published.
+        '''
+        today = date.today()
+        if serie in self.monthly:
+            return self.__previous_month(date(today.year, today.month, 1))
+
+        qdate = today - timedelta(days=1)
+        while qdate.weekday() >= 5:
+            qdate -= timedelta(days=1)
+        return qdate
+
+    def value(self, serie, qdate):
+        '''
+        @return: The value of a series on a date (between 0 and 2).
+        '''
+        return round(Random(serie * 1000003 + qdate.toordinal())
+                     .uniform(0, 2), 4)
+
+    @staticmethod
+    def __next_month(qdate):
+        return date(qdate.year + qdate.month // 12, qdate.month % 12 + 1, 1)
+
+    @staticmethod
+    def __previous_month(qdate):
+        if qdate.month == 1:
+            return date(qdate.year - 1, 12, 1)
+        return date(qdate.year, qdate.month - 1, 1)
+
+
+class FakeSGSHandler(BaseHTTPRequestHandler):
+    '''
+    HTTP handler of the fake service.  Settings are taken from the server.
+    '''
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def do_GET(self):
+        self.__send(200, build_wsdl(self.server.endpoint_url))
+
+    def do_POST(self):
+        length = int(self.headers.getheader('content-length', 0))
+        request = fromstring(self.rfile.read(length))
+
+        call = None
+        for element in request.iter():
+            if element.tag.startswith('{' + NS + '}'):
+                call = element
+                break
+
+        operation = call.tag.split('}', 1)[1] if call is not None else None
+        if operation not in OPERATIONS:
+            self.__send(500, ENVELOPE.format(
+                FAULT.format('Unknown operation: {0}'.format(operation))))
+            return
+
+        self.server.delay()
+        fault = self.server.fault()
+        if fault:
+            self.__send(500, ENVELOPE.format(FAULT.format(fault)))
+            return
+
+        arguments = dict((child.tag.rsplit('}', 1)[-1], child)
+                         for child in call)
+        result = getattr(self, '_' + operation)(arguments)
+        self.__send(200, ENVELOPE.format(
+            '<ns1:{0}Response soapenv:encodingStyle='
+            '"http://schemas.xmlsoap.org/soap/encoding/">{1}'
+            '</ns1:{0}Response>'.format(operation, result)))
+
+    def __send(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Arguments
+
+    @staticmethod
+    def __series(arguments):
+        element = arguments['in0']
+        if len(element):
+            return [int(item.text) for item in element]
+        return [int(element.text)]
+
+    @staticmethod
+    def __date(arguments, name):
+        day, month, year = arguments[name].text.strip().split('/')
+        return date(int(year), int(month), int(day))
+
+    # Results
+
+    def __valor_vo(self, tag, serie, qdate):
+        qvalue = self.server.generator.value(serie, qdate)
+        return ('<{0} xsi:type="ns2:WSValorSerieVO">'
+                '<ano xsi:type="xsd:int">{1}</ano>'
+                '<anoFim xsi:type="xsd:int">0</anoFim>'
+                '<bloqueado xsi:type="xsd:boolean">false</bloqueado>'
+                '<bloqueioLiberado xsi:type="xsd:boolean">false'
+                '</bloqueioLiberado>'
+                '<dia xsi:type="xsd:int">{3}</dia>'
+                '<diaFim xsi:type="xsd:int">0</diaFim>'
+                '<mes xsi:type="xsd:int">{2}</mes>'
+                '<mesFim xsi:type="xsd:int">0</mesFim>'
+                '<oid xsi:type="xsd:long">0</oid>'
+                '<oidSerie xsi:type="xsd:long">{4}</oidSerie>'
+                '<svalor xsi:type="soapenc:string">{5}</svalor>'
+                '<valor xsi:type="xsd:decimal">{5}</valor>'
+                '</{0}>').format(tag, qdate.year, qdate.month, qdate.day,
+                                 serie, qvalue)
+
+    def __serie_vo(self, tag, serie, dates, last_value=False):
+        generator = self.server.generator
+        last_date = generator.last_date(serie)
+        if last_value:
+            ultimo_valor = self.__valor_vo('ultimoValor', serie, last_date)
+            valores = '<valores xsi:nil="true"/>'
+        else:
+            ultimo_valor = '<ultimoValor xsi:nil="true"/>'
+            valores = ''.join(self.__valor_vo('item', serie, qdate)
+                              for qdate in dates)
+            valores = ('<valores xsi:type="soapenc:Array" soapenc:arrayType='
+                       '"ns2:WSValorSerieVO[{0}]">{1}</valores>'
+                       .format(len(dates), valores))
+
+        periodicity = generator.periodicity(serie)
+        return ('<{0} xsi:type="ns2:WSSerieVO">'
+                '<oid xsi:type="xsd:long">{1}</oid>'
+                '<nomeCompleto xsi:type="soapenc:string">Serie {1}'
+                '</nomeCompleto>'
+                '<periodicidade xsi:type="soapenc:string">{2}'
+                '</periodicidade>'
+                '<periodicidadeSigla xsi:type="soapenc:string">{2}'
+                '</periodicidadeSigla>'
+                '<valorDiaNaoUtil xsi:type="xsd:boolean">false'
+                '</valorDiaNaoUtil>'
+                '{3}{4}'
+                '</{0}>').format(tag, serie, periodicity, ultimo_valor,
+                                 valores)
+
+    @staticmethod
+    def __string(tag, text):
+        return '<{0} xsi:type="soapenc:string">{1}</{0}>'.format(
+            tag, escape(text))
+
+    @staticmethod
+    def __xml_value(qvalue):
+        return '{0:.4f}'.format(qvalue).replace('.', ',')
+
+    # Operations
+
+    def _getValoresSeriesVO(self, arguments):
+        series = self.__series(arguments)
+        initial_date = self.__date(arguments, 'in1')
+        final_date = self.__date(arguments, 'in2')
+
+        generator = self.server.generator
+        items = ''.join(self.__serie_vo('item', serie,
+                                        generator.dates(serie, initial_date,
+                                                        final_date))
+                        for serie in series)
+        return ('<getValoresSeriesVOReturn xsi:type="soapenc:Array" '
+                'soapenc:arrayType="ns2:WSSerieVO[{0}]">{1}'
+                '</getValoresSeriesVOReturn>'.format(len(series), items))
+
+    def _getValoresSeriesXML(self, arguments):
+        initial_date = self.__date(arguments, 'in1')
+        final_date = self.__date(arguments, 'in2')
+
+        generator = self.server.generator
+        xml = ["<?xml version='1.0' encoding='ISO-8859-1'?><SERIES>"]
+        for serie in self.__series(arguments):
+            monthly = generator.periodicity(serie) == 'M'
+            xml.append("<SERIE ID='{0}'>".format(serie))
+            for qdate in generator.dates(serie, initial_date, final_date):
+                xml.append('<ITEM><DATA>{0}</DATA><VALOR>{1}</VALOR></ITEM>'
+                           .format(qdate.strftime('%m/%Y' if monthly
+                                                  else '%d/%m/%Y'),
+                                   self.__xml_value(
+                                       generator.value(serie, qdate))))
+            xml.append('</SERIE>')
+        xml.append('</SERIES>')
+
+        return self.__string('getValoresSeriesXMLReturn', ''.join(xml))
+
+    def _getUltimoValorVO(self, arguments):
+        serie = self.__series(arguments)[0]
+        return self.__serie_vo('getUltimoValorVOReturn', serie, None,
+                               last_value=True)
+
+    def _getUltimoValorXML(self, arguments):
+        serie = self.__series(arguments)[0]
+        generator = self.server.generator
+        qdate = generator.last_date(serie)
+        xml = ("<?xml version='1.0' encoding='ISO-8859-1'?>"
+               "<resposta status='2'><SERIE><NOME>Serie {0}</NOME>"
+               "<CODIGO>{0}</CODIGO><PERIODICIDADE>{1}</PERIODICIDADE>"
+               "<UNIDADE>%</UNIDADE><DATA><DIA>{2}</DIA><MES>{3}</MES>"
+               "<ANO>{4}</ANO></DATA><VALOR>{5}</VALOR></SERIE></resposta>"
+               .format(serie, generator.periodicity(serie), qdate.day,
+                       qdate.month, qdate.year,
+                       self.__xml_value(generator.value(serie, qdate))))
+
+        return self.__string('getUltimoValorXMLReturn', xml)
+
+    def _getValor(self, arguments):
+        serie = self.__series(arguments)[0]
+        qdate = self.__date(arguments, 'in1')
+        return ('<getValorReturn xsi:type="xsd:decimal">{0}'
+                '</getValorReturn>'.format(
+                    self.server.generator.value(serie, qdate)))
+
+    def _getValorEspecial(self, arguments):
+        serie = self.__series(arguments)[0]
+        initial_date = self.__date(arguments, 'in1')
+        final_date = self.__date(arguments, 'in2')
+
+        generator = self.server.generator
+        product = 1.0
+        for qdate in generator.dates(serie, initial_date, final_date):
+            product *= 1 + generator.value(serie, qdate) / 100
+
+        return ('<getValorEspecialReturn xsi:type="xsd:decimal">{0:.6f}'
+                '</getValorEspecialReturn>'.format((product - 1) * 100))
+
+
+class FakeSGSServer(ThreadingMixIn, HTTPServer):
+    '''
+    Fake SGS service running in a background thread.
+    '''
+
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, jitter=0.0, fault_rate=0.0,
+                 rate_limit=None, seed=None, verbose=False):
+        '''
+        Constructor
+        @param port: Port to listen on (0 for any free port).
+        @param latency: Delay of each call, in seconds.
+        @param jitter: Maximum random delay added to each call, in seconds.
+        @param fault_rate: Probability (0 to 1) of a call failing.
+        @param rate_limit: Maximum number of calls per second.  Calls over
+                           the limit fail.  If None, there is no limit.
+        @param seed: Seed of the random jitter and faults.
+        @param verbose: If True, requests are logged.
+        '''
+        HTTPServer.__init__(self, ('127.0.0.1', port), FakeSGSHandler)
+
+        self.latency = latency
+        self.jitter = jitter
+        self.fault_rate = fault_rate
+        self.rate_limit = rate_limit
+        self.verbose = verbose
+        self.generator = SeriesGenerator()
+
+        self.calls = 0
+        self.faults = 0
+
+        self.__random = Random(seed)
+        self.__lock = Lock()
+        self.__window = (0, 0)  # second, calls in that second
+        self.__thread = None
+
+    @property
+    def endpoint_url(self):
+        return 'http://127.0.0.1:{0}/sgspub/services/FachadaWSSGS'.format(
+            self.server_port)
+
+    @property
+    def wsdl_url(self):
+        return 'http://127.0.0.1:{0}/sgspub/FachadaWSSGS.wsdl'.format(
+            self.server_port)
+
+    def start(self):
+        '''
+        Start serving in a background thread.
+        '''
+        self.__thread = Thread(target=self.serve_forever)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        '''
+        Stop serving and close the socket.
+        '''
+        self.shutdown()
+        self.server_close()
+        self.__thread.join()
+
+    def delay(self):
+        '''
+        Wait for the latency of a call.
+        '''
+        with self.__lock:
+            jitter = self.__random.uniform(0, self.jitter)
+
+        if self.latency or jitter:
+            sleep(self.latency + jitter)
+
+    def fault(self):
+        '''
+        Decide whether a call fails.
+        @return: The fault message or None.
+        '''
+        with self.__lock:
+            self.calls += 1
+
+            second = int(time())
+            window_second, window_calls = self.__window
+            window_calls = window_calls + 1 if second == window_second else 1
+            self.__window = (second, window_calls)
+
+            message = None
+            if self.rate_limit is not None and window_calls > self.rate_limit:
+                message = 'Rate limit exceeded'
+            elif self.__random.random() < self.fault_rate:
+                message = 'Service unavailable'
+
+            if message:
+                self.faults += 1
+            return message
+
+
+def main():
+    parser = ArgumentParser(description='Fake SGS web service.')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='delay of each call, in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='maximum random delay added, in seconds')
+    parser.add_argument('--fault-rate', type=float, default=0.0,
+                        help='probability of a call failing (0 to 1)')
+    parser.add_argument('--rate-limit', type=int,
+                        help='maximum number of calls per second')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    server = FakeSGSServer(args.port, args.latency, args.jitter,
+                           args.fault_rate, args.rate_limit, args.seed,
+                           verbose=True)
+    print('WSDL at %s' % server.wsdl_url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+'''
+Synthetic SGS data for the benchmarks.
+'''
+
+from datetime import date, timedelta
+
+from suds.sudsobject import Factory
+
+
+def daily_points(series, years, final_date=date(2013, 12, 31)):
+    '''
+    @return: A list of tuples "serie, date, value" with one value per
+             business day, sorted by date.
+    '''
+    qdate = final_date - timedelta(days=365 * years)
+
+    points = list()
+    while qdate <= final_date:
+        if qdate.weekday() < 5:
+            for serie in series:
+                points.append((serie, qdate, (serie + qdate.day) / 100.0))
+        qdate += timedelta(days=1)
+
+    return points
+
+
+def build_valor_vo(points):
+    '''
+    Build the WSValorSerieVO objects suds would deserialize from a response.
+    @return: A list of WSValorSerieVO.
+    '''
+    return [Factory.object('WSValorSerieVO',
+                           dict(oidSerie=serie, ano=qdate.year,
+                                mes=qdate.month, dia=qdate.day,
+                                valor=str(qvalue), svalor=str(qvalue),
+                                bloqueado=False))
+            for serie, qdate, qvalue in points]
+
+
+def build_serie_vo(points):
+    '''
+    Build the response of "getValoresSeriesVO".
+    @return: A list of WSSerieVO, one for each series.
+    '''
+    series = dict()
+    for point in points:
+        series.setdefault(point[0], list()).append(point)
+
+    return [Factory.object('WSSerieVO',
+                           dict(oid=serie, periodicidadeSigla='D',
+                                valores=build_valor_vo(series[serie])))
+            for serie in sorted(series)]
+
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+'''
+Time a full myquotes.py run against the local fake SGS service (see
+benchmarks.fakesgs), through the real suds code path.
+
+Usage:
+    python -m benchmarks.load [--latency S] [--jitter S] [--fault-rate P]
+                              [--rate-limit N] [--repeat N] [--output FILE]
+'''
+
+from __future__ import print_function
+from argparse import ArgumentParser
+from platform import python_version
+from shutil import rmtree
+from tempfile import mkdtemp
+import json
+
+from benchmarks import measure
+from benchmarks.fakesgs import FakeSGSServer
+from benchmarks.pipeline import run_myquotes
+from quotesource.sgs import SGS
+
+
+def main():
+    parser = ArgumentParser(description='Load test of myquotes.py against '
+                                        'a fake SGS service.')
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--jitter', type=float, default=0.1)
+    parser.add_argument('--fault-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=int)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='JSON file (default: stdout)')
+    args = parser.parse_args()
+
+    server = FakeSGSServer(latency=args.latency, jitter=args.jitter,
+                           fault_rate=args.fault_rate,
+                           rate_limit=args.rate_limit, seed=0)
+    server.start()
+
+    wsdl_cache = mkdtemp()
+    SGS.WSDL_URL = server.wsdl_url
+    SGS.WSDL_CACHE_DIR = wsdl_cache
+    try:
+        seconds = measure(run_myquotes, repeat=args.repeat)
+    finally:
+        server.stop()
+        rmtree(wsdl_cache)
+
+    report = {
+        'python': python_version(),
+        'latency': args.latency,
+        'jitter': args.jitter,
+        'fault_rate': args.fault_rate,
+        'rate_limit': args.rate_limit,
+        'seconds': seconds,
+        'calls': server.calls // args.repeat,
+        'faults': server.faults // args.repeat,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+'''
+Time each stage of the fetch-to-CSV pipeline over synthetic data:
+
+ * build_result: SGS.__build_result over WSValorSerieVO objects
+ * update_values: QuickenCSV.update_values from a data source
+ * accumulate_sum, accumulate_interest: QuickenCSV.accumulate_data
+   (12 values window)
+ * fix_data: QuickenCSV.fix_data
+ * export_to_file: QuickenCSV.export_to_file (no accumulation)
+ * myquotes: the whole myquotes.py run, with the web service mocked
+
+No web service is used.  Results are printed (or saved) as JSON.
+
+Usage:
+    python -m benchmarks.pipeline [--series N] [--years N] [--repeat N]
+                                  [--output FILE]
+'''
+
+from __future__ import print_function
+from argparse import ArgumentParser
+from contextlib import contextmanager
+from os import chdir, devnull, getcwd
+from os.path import abspath, dirname, join
+from platform import python_version
+from runpy import run_path
+from shutil import rmtree
+from tempfile import mkdtemp
+import json
+import sys
+
+from benchmarks import measure
+from benchmarks.fixtures import build_serie_vo, build_valor_vo, daily_points
+from quickencsv import QuickenCSV
+from quotesource.sgs import SGS
+
+
+ROOT = dirname(dirname(abspath(__file__)))
+MYQUOTES = join(ROOT, 'myquotes.py')
+
+
+class FixtureSource(object):
+    '''
+    Data source returning fixed values, whatever the dates requested.
+    '''
+
+    def __init__(self, values):
+        self.values = values
+
+    def get_values(self, initial_date, final_date):
+        return self.values
+
+
+@contextmanager
+def mocked_sgs():
+    '''
+    Replace the "getValoresSeriesVO" request of SGS by synthetic data.
+    '''
+    def soap_get_values(self, initial_date, final_date, xml=False,
+                        series=None):
+        series = series or self._SGS__series
+        years = (final_date - initial_date).days / 365.0
+        return build_serie_vo(daily_points(series, years, final_date))
+
+    original = SGS._SGS__soap_get_values
+    SGS._SGS__soap_get_values = soap_get_values
+    try:
+        yield
+    finally:
+        SGS._SGS__soap_get_values = original
+
+
+@contextmanager
+def quiet():
+    '''
+    Discard the standard output.
+    '''
+    stdout = sys.stdout
+    with open(devnull, 'w') as sys.stdout:
+        try:
+            yield
+        finally:
+            sys.stdout = stdout
+
+
+def run_myquotes():
+    '''
+    Run myquotes.py in an empty temporary directory.
+    '''
+    cwd = getcwd()
+    workdir = mkdtemp()
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    try:
+        chdir(workdir)
+        with quiet():
+            run_path(MYQUOTES, run_name='__main__')
+    finally:
+        chdir(cwd)
+        rmtree(workdir)
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark the fetch-to-CSV '
+                                        'pipeline over synthetic data.')
+    parser.add_argument('--series', type=int, default=10)
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='JSON file (default: stdout)')
+    args = parser.parse_args()
+
+    series = range(1, args.series + 1)
+    points = daily_points(series, args.years)
+    vo = build_valor_vo(points)
+
+    sgs = SGS(series)
+    values = sgs._SGS__build_result(vo)
+
+    qcsv = QuickenCSV(FixtureSource(values))
+    qcsv.update_values(None, None)
+    rows = [(qserie, qdate, qvalue)
+            for (qserie, qdate), qvalue in qcsv.values.iteritems()]
+
+    workdir = mkdtemp()
+    target = join(workdir, 'benchmark.csv')
+
+    def update_values():
+        QuickenCSV(FixtureSource(values)).update_values(None, None)
+
+    def accumulate(function):
+        qcsv.accumulate_func = function
+        return qcsv.accumulate_data(rows, 12)
+
+    stages = [
+        ('build_result', lambda: sgs._SGS__build_result(vo)),
+        ('update_values', update_values),
+        ('accumulate_sum', lambda: accumulate('sum')),
+        ('accumulate_interest', lambda: accumulate('interest')),
+        ('fix_data', lambda: qcsv.fix_data(rows)),
+        ('export_to_file', lambda: qcsv.export_to_file(target)),
+    ]
+
+    results = dict()
+    try:
+        for name, func in stages:
+            results[name] = measure(func, repeat=args.repeat)
+    finally:
+        rmtree(workdir)
+
+    # Independent of the number of series and years: myquotes.py always
+    # requests the same series and windows
+    with mocked_sgs():
+        results['myquotes'] = measure(run_myquotes, repeat=args.repeat)
+
+    report = {
+        'python': python_version(),
+        'series': args.series,
+        'years': args.years,
+        'values': len(points),
+        'seconds': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+'''
+Compare the two ways SGS.get_values can read a large response, through
+the real suds client against the local fake SGS service (see
+benchmarks.fakesgs):
+
+ * VO: "getValoresSeriesVO", whose SOAP response suds deserializes into
+   WSSerieVO/WSValorSerieVO objects, which are flattened by
+   SGS.__build_result.
+ * XML: "getValoresSeriesXML", whose string is parsed incrementally by
+   quotesource.sgsxml, without building an object per value.
+
+Both paths send the same request and get the same values.  Besides the
+best time of each path, the average time of its round trips alone (see
+soaptransport.MeasuredTransport) is reported, so the rest is the time
+spent serializing and deserializing.
+
+Usage:
+    python -m benchmarks.xml_vs_vo [series] [years]
+'''
+
+from __future__ import print_function
+from datetime import date, timedelta
+from shutil import rmtree
+from sys import argv
+from tempfile import mkdtemp
+
+from benchmarks import measure
+from benchmarks.fakesgs import FakeSGSServer
+from instrumentation import Instrument, Stats
+from quote import Quote
+from quotesource.sgs import SGS
+
+
+def send_seconds(stats, operation):
+    '''
+    @return: The average seconds of the round trips of an operation.
+    '''
+    calls, seconds = 0, 0.0
+    for (label, stage), totals in stats.totals.items():
+        if label == operation and stage == 'soap_send':
+            calls, seconds = totals[:2]
+    return seconds / calls if calls else 0.0
+
+
+def main():
+    num_series = int(argv[1]) if len(argv) > 1 else 10
+    years = int(argv[2]) if len(argv) > 2 else 2
+
+    # Series not in fakesgs.MONTHLY have a value on each business day
+    series = range(1, num_series + 1)
+    final_date = date.today() - timedelta(days=1)
+    initial_date = final_date - timedelta(days=365 * years)
+
+    server = FakeSGSServer()
+    server.start()
+
+    wsdl_cache = mkdtemp()
+    SGS.WSDL_URL = server.wsdl_url
+    SGS.WSDL_CACHE_DIR = wsdl_cache
+
+    stats = Stats()
+    Quote.instrument = Instrument(stats)
+    try:
+        results = dict()
+        times = dict()
+        for operation, xml in (('VO', False), ('XML', True)):
+            sgs = SGS(series, xml=xml)
+            sgs.label = operation
+            # The first request builds the SOAP client (and parses the
+            # WSDL), which is not measured
+            results[operation] = sgs.get_values(initial_date, final_date)
+            stats.totals.clear()
+            best = measure(sgs.get_values, initial_date, final_date)
+            times[operation] = best, send_seconds(stats, operation)
+    finally:
+        Quote.instrument = None
+        server.stop()
+        rmtree(wsdl_cache)
+
+    assert results['VO'] and results['VO'] == results['XML']
+
+    vo_time, vo_send = times['VO']
+    xml_time, xml_send = times['XML']
+    print('%d series, %d years, %d values' % (num_series, years,
+                                             len(results['VO'])))
+    print('VO:  %8.3f s (round trip %.3f s)' % (vo_time, vo_send))
+    print('XML: %8.3f s (round trip %.3f s, %.1fx)' %
+          (xml_time, xml_send, vo_time / xml_time))
+
+
+if __name__ == '__main__':
+    main()
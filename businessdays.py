@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+from array import array
+from datetime import date, timedelta
+
+
+def easter(year):
+    '''
+    Compute the date of Easter Sunday (Gregorian calendar).
+    @return: A date.
+    '''
+    # Anonymous Gregorian algorithm (Meeus/Jones/Butcher)
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def brazil_holidays(year):
+    '''
+    National holidays of Brazil in a year, as used by the financial market
+    (including Carnaval and Corpus Christi).
+    @return: A set of dates.
+    '''
+    holidays = set(date(year, month, day) for month, day in (
+        (1, 1),  # Confraternização Universal
+        (4, 21),  # Tiradentes
+        (5, 1),  # Dia do Trabalho
+        (9, 7),  # Independência
+        (10, 12),  # Nossa Senhora Aparecida
+        (11, 2),  # Finados
+        (11, 15),  # Proclamação da República
+        (12, 25),  # Natal
+    ))
+
+    if year >= 2024:
+        holidays.add(date(year, 11, 20))  # Consciência Negra
+
+    easter_sunday = easter(year)
+    for days in (-48, -47,  # Carnaval (Monday and Tuesday)
+                 -2,  # Sexta-feira Santa
+                 60):  # Corpus Christi
+        holidays.add(easter_sunday + timedelta(days=days))
+
+    return holidays
+
+
+class BusinessCalendar(object):
+    '''
+    Precomputed calendar of business days.
+
+    Days from "first_year" to "last_year" are kept in a bitmap indexed by
+    date ordinal (one byte per day), with the running count of business
+    days beside it, so checking a day and counting the business days
+    between two dates take constant time.
+
+    Usage:
+        if BRAZIL.count(initial_date, final_date) == 0:
+            ...  # nothing can be published in the interval
+    '''
+
+    def __init__(self, first_year=1980, last_year=2080,
+                 holidays=brazil_holidays):
+        '''
+        Constructor
+        @param holidays: Function returning the set of holidays of a year.
+        '''
+        self.first_date = date(first_year, 1, 1)
+        self.last_date = date(last_year, 12, 31)
+
+        first = self.first_date.toordinal()
+        size = self.last_date.toordinal() - first + 1
+
+        # Weekends: date ordinal 1 (January 1st, year 1) is a Monday
+        days = bytearray(size)
+        for index in xrange(size):
+            if (first + index - 1) % 7 < 5:
+                days[index] = 1
+
+        for year in xrange(first_year, last_year + 1):
+            for holiday in holidays(year):
+                days[holiday.toordinal() - first] = 0
+
+        # counts[i]: number of business days before index i
+        counts = array('i', [0]) * (size + 1)
+        total = 0
+        for index in xrange(size):
+            total += days[index]
+            counts[index + 1] = total
+
+        self.__first = first
+        self.__days = days
+        self.__counts = counts
+
+    def is_business_day(self, qdate):
+        '''
+        @return: True if the date is a business day.
+        @raise ValueError: if the date is out of the calendar.
+        '''
+        return self.__days[self.__index(qdate)] == 1
+
+    def count(self, initial_date, final_date):
+        '''
+        Count the business days in an interval of dates.
+        @return: The number of business days, including both ends.
+        @raise ValueError: if a date is out of the calendar.
+        '''
+        if final_date < initial_date:
+            return 0
+        return self.__counts[self.__index(final_date) + 1] - \
+            self.__counts[self.__index(initial_date)]
+
+    def following(self, qdate):
+        '''
+        @return: The first business day on or after the date, or None if
+                 there is none in the calendar.
+        '''
+        index = self.__index(qdate)
+        days = self.__days
+        while index < len(days):
+            if days[index]:
+                return date.fromordinal(self.__first + index)
+            index += 1
+        return None
+
+    def preceding(self, qdate):
+        '''
+        @return: The last business day on or before the date, or None if
+                 there is none in the calendar.
+        '''
+        index = self.__index(qdate)
+        days = self.__days
+        while index >= 0:
+            if days[index]:
+                return date.fromordinal(self.__first + index)
+            index -= 1
+        return None
+
+    def trim(self, initial_date, final_date):
+        '''
+        Shrink an interval of dates to its first and last business days.
+        @return: A tuple "initial date, final date" or None if there are
+                 no business days in the interval.
+        '''
+        if self.count(initial_date, final_date) == 0:
+            return None
+        return self.following(initial_date), self.preceding(final_date)
+
+    def business_days(self, initial_date, final_date):
+        '''
+        @return: A generator with the business days of an interval of
+                 dates, in ascending order.
+        '''
+        first = self.__first
+        days = self.__days
+        for index in xrange(self.__index(initial_date),
+                            self.__index(final_date) + 1):
+            if days[index]:
+                yield date.fromordinal(first + index)
+
+    def first_gap(self, dates, initial_date, final_date):
+        '''
+        Find the first business day of an interval without a value.
+        @param dates: Collection with the dates that have values.
+        @return: A date or None if all business days have values.
+        '''
+        found = sum(1 for qdate in dates
+                    if initial_date <= qdate <= final_date and
+                        self.is_business_day(qdate))
+        if found == self.count(initial_date, final_date):
+            return None
+
+        dates = set(dates)
+        for qdate in self.business_days(initial_date, final_date):
+            if qdate not in dates:
+                return qdate
+        return None
+
+    def __index(self, qdate):
+        index = qdate.toordinal() - self.__first
+        if index < 0 or index >= len(self.__days):
+            msg = 'Date {0} is out of the calendar ({1} to {2}).'
+            raise ValueError(msg.format(qdate, self.first_date,
+                                        self.last_date))
+        return index
+
+
+# Calendar of the Brazilian financial market
+BRAZIL = BusinessCalendar()
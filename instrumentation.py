@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+from threading import Lock
+from timeit import default_timer
+import json
+import logging
+
+
+class Record(object):
+    '''
+    Measures of one execution of a stage.
+
+    Besides the duration, the code being measured may fill the number of
+    requests done, rows produced and bytes transferred.
+    '''
+
+    __slots__ = ('label', 'stage', 'seconds', 'requests', 'rows', 'bytes')
+
+    def __init__(self, label, stage, requests=0, rows=0, bytes=0):
+        self.label = label
+        self.stage = stage
+        self.seconds = 0.0
+        self.requests = requests
+        self.rows = rows
+        self.bytes = bytes
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+
+class Instrument(object):
+    '''
+    Measures the stages of quote sources and exporters, sending each
+    record to a list of sinks.
+
+    A sink is any object with a "record(record)" method, like Stats,
+    LogSink and JSONSink.  Sinks must be thread safe, since sources may
+    run at the same time.
+
+    Usage:
+        stats = Stats()
+        Quote.instrument = QuickenCSV.instrument = Instrument(stats)
+        ...
+        print('\\n'.join(stats.summary()))
+    '''
+
+    def __init__(self, *sinks):
+        self.sinks = list(sinks)
+
+    def stage(self, label, stage, **counts):
+        '''
+        Measure a stage.
+        @param label: Who is running the stage (e.g. a source or job name).
+        @param stage: Name of the stage.
+        @param counts: Initial requests, rows and bytes.
+        @return: A context manager returning the Record being measured.
+        '''
+        return _Timer(self, Record(label, stage, **counts))
+
+    def emit(self, record):
+        for sink in self.sinks:
+            sink.record(record)
+
+
+class _Timer(object):
+
+    __slots__ = ('instrument', 'record', 'start')
+
+    def __init__(self, instrument, record):
+        self.instrument = instrument
+        self.record = record
+
+    def __enter__(self):
+        self.start = default_timer()
+        return self.record
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.record.seconds = default_timer() - self.start
+        self.instrument.emit(self.record)
+
+
+class _NullRecord(object):
+    '''
+    Record that ignores all measures.
+    '''
+
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+# Returned instead of a timer when instrumentation is disabled: it is its
+# own context manager and ignores everything, so it costs almost nothing.
+NULL_STAGE = _NullRecord()
+
+
+class Stats(object):
+    '''
+    Sink keeping totals by label and stage in memory.
+    '''
+
+    def __init__(self):
+        self.totals = dict()  # (label, stage): [calls, seconds, requests,
+                              #                  rows, bytes]
+        self.__lock = Lock()
+
+    def record(self, record):
+        with self.__lock:
+            totals = self.totals.setdefault((record.label, record.stage),
+                                            [0, 0.0, 0, 0, 0])
+            totals[0] += 1
+            totals[1] += record.seconds
+            totals[2] += record.requests
+            totals[3] += record.rows
+            totals[4] += record.bytes
+
+    def summary(self):
+        '''
+        @return: A list of lines with the totals, sorted by label and stage.
+        '''
+        with self.__lock:
+            totals = sorted((key, list(values))
+                            for key, values in self.totals.items())
+
+        # The label column fits the longest label
+        width = max([30] + [len(label) for (label, _), _ in totals])
+        lines = ['%-*s %-20s %6s %9s %8s %9s %11s' %
+                 (width, 'LABEL', 'STAGE', 'CALLS', 'SECONDS', 'REQUESTS',
+                  'ROWS', 'BYTES')]
+        for (label, stage), stage_totals in totals:
+            lines.append('%-*s %-20s %6d %9.3f %8d %9d %11d' %
+                         ((width, label, stage) + tuple(stage_totals)))
+
+        return lines
+
+
+class LogSink(object):
+    '''
+    Sink writing each record as a log line.
+    '''
+
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger('br4quicken')
+        self.level = level
+
+    def record(self, record):
+        self.logger.log(self.level,
+                        '%s %s: %.3f s, %d requests, %d rows, %d bytes',
+                        record.label, record.stage, record.seconds,
+                        record.requests, record.rows, record.bytes)
+
+
+class JSONSink(object):
+    '''
+    Sink appending each record to a file as a JSON line.
+    '''
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.__lock = Lock()
+
+    def record(self, record):
+        line = json.dumps(record.as_dict(), sort_keys=True)
+        with self.__lock, open(self.filename, 'a') as f:
+            f.write(line + '\n')
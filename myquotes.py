@@ -3,9 +3,17 @@
 from __future__ import print_function
 from datetime import date, timedelta
 from locale import setlocale, LC_TIME
+from sched import scheduler
+from sys import argv
+from time import sleep, time
 
 if __name__ == '__main__':
+    from batchexport import BatchExporter
+    from instrumentation import Instrument, Stats
     from quickencsv import QuickenCSV
+    from quote import Quote
+    from requestplanner import RequestPlanner
+    from seriescache import SeriesCache
     from quotesource.sgs import SGS
     #from quotesource.gf import GF
 
@@ -63,27 +71,191 @@ if __name__ == '__main__':
         ], 12, 'interest'),
     }
 
+    # Series published on every business day of the financial market (and
+    # only on them): their requests skip weekends and holidays.  Not 7
+    # (B3 closes on some business days, like December 24 and 31) nor 432
+    # (published on every calendar day).
+    BUSINESS_SERIES = [1, 11, 12, 1178, 4389]
+
     FILENAME = 'INDEXES_BR_QUICKEN.csv'
+    SYMBOLS_DIR = 'INDEXES_BR_QUICKEN'  # one CSV file per symbol
+    CACHE_FILENAME = 'INDEXES_BR_CACHE.dat'
+    REPLAY_DIR = 'INDEXES_BR_REPLAY'  # responses recorded with --replay
     INTERVAL = 60  # days
+    MAX_WORKERS = 4  # requests at the same time
+
+    # Daemon mode (run with --daemon): seconds between refreshes of a job
+    DAILY_REFRESH = 60 * 60
+    MONTHLY_REFRESH = 12 * 60 * 60
+    ERROR_REFRESH = 10 * 60
 
-    END_DATE = date.today()
-    INI_DATE = END_DATE - timedelta(days=INTERVAL)
+    cache = SeriesCache(CACHE_FILENAME)
 
-    for indexjob in INDEXES:
-        series, accumulate, accfunction = INDEXES[indexjob]
-        datasource = SGS(series)
+    def initial_date(accumulate, end_date, accumulated_until=None):
+        # Accumulated jobs need one more year to fill the first windows,
+        # unless their windows are resumed from the last export
+        if accumulated_until is not None:
+            return min(end_date - timedelta(days=INTERVAL),
+                       accumulated_until + timedelta(days=1))
+        elif accumulate > 1:
+            return end_date - timedelta(days=INTERVAL + 365)
+        else:
+            return end_date - timedelta(days=INTERVAL)
 
-        print('Downloading %-40s... ' % (indexjob), end='')
+    def print_timing():
+        if Quote.instrument is not None:
+            print()
+            print('\n'.join(stats.summary()))
 
-        qcsv = QuickenCSV(datasource, accumulate, accfunction)
+    def tickers(series):
+        source = SGS(series)
+        return [source.build_ID(serie) for serie in series]
 
-        if accumulate > 1:
-            this_ini_date = END_DATE - timedelta(days=INTERVAL + 365)
-        else:
-            this_ini_date = INI_DATE
+    def run_once():
+        end_date = date.today()
+
+        # All jobs are planned together, so each series is downloaded only
+        # once, even when it is used by several jobs.  Series are probed
+        # first, so only those with new values are downloaded.
+        planner = RequestPlanner(lambda series: SGS(
+            series, cache, probe=True, business_series=BUSINESS_SERIES))
+
+        qcsvs = dict()
+        initial_dates = dict()
+        for indexjob in INDEXES:
+            series, accumulate, accfunction = INDEXES[indexjob]
+
+            qcsv = QuickenCSV(None, accumulate, accfunction, indexjob)
+            until = qcsv.accumulated_until(FILENAME, tickers(series))
+            initial_dates[indexjob] = initial_date(accumulate, end_date, until)
+
+            planner.add_job(indexjob, series, initial_dates[indexjob],
+                            end_date)
+            qcsv.data_source = planner.source(indexjob)
+            qcsvs[indexjob] = qcsv
 
-        qcsv.update_values(this_ini_date, END_DATE)
+        print('Downloading %d jobs (up to %d requests at a time)... ' %
+              (len(INDEXES), MAX_WORKERS), end='')
 
-        lines = qcsv.export_to_file(FILENAME, clear_file=False)
+        requests = planner.fetch(MAX_WORKERS)
+
+        print('success! (%d requests)' % requests)
+
+        for indexjob in INDEXES:
+            qcsvs[indexjob].update_values(initial_dates[indexjob], end_date)
+
+        # All jobs are exported together, in a single pass over the files
+        print('Exporting %d jobs... ' % len(INDEXES), end='')
+
+        exporter = BatchExporter(qcsvs.values(), SYMBOLS_DIR)
+        lines = exporter.export_to_file(FILENAME, clear_file=False,
+                                        only_new=True)
 
         print('success! (%d lines)' % lines)
+
+        cache.save()
+
+    def run_daemon():
+        # Downloaded values are kept between refreshes, and the output files
+        # are appended to only when some value changes.  Jobs due at the
+        # same time are planned together, as in run_once, so each series is
+        # downloaded only once per refresh.
+        qcsvs = dict()
+        for indexjob in INDEXES:
+            series, accumulate, accfunction = INDEXES[indexjob]
+            qcsvs[indexjob] = QuickenCSV(None, accumulate, accfunction,
+                                         indexjob)
+
+        jobs = scheduler(time, sleep)
+        pending = set()  # jobs with changes not exported yet
+
+        def refresh_interval(series):
+            # Only probed series have a known periodicity
+            periodicities = [(cache.probe_info(serie) or (None,) * 3)[2]
+                             for serie in series]
+            if None in periodicities or 'D' in periodicities:
+                return DAILY_REFRESH
+            return MONTHLY_REFRESH
+
+        def refresh(indexjobs):
+            end_date = date.today()
+
+            planner = RequestPlanner(lambda series: SGS(
+                series, cache, probe=True, business_series=BUSINESS_SERIES))
+
+            initial_dates = dict()
+            for indexjob in indexjobs:
+                series, accumulate, _ = INDEXES[indexjob]
+                qcsv = qcsvs[indexjob]
+
+                until = qcsv.accumulated_until(FILENAME, tickers(series))
+                initial_dates[indexjob] = initial_date(accumulate, end_date,
+                                                       until)
+                planner.add_job(indexjob, series, initial_dates[indexjob],
+                                end_date)
+                qcsv.data_source = planner.source(indexjob)
+
+            # Errors (like the output file locked while Quicken imports it)
+            # never stop the daemon: the jobs are refreshed again later, and
+            # their changes are kept until exported
+            try:
+                planner.fetch(MAX_WORKERS)
+
+                for indexjob in indexjobs:
+                    changes = qcsvs[indexjob].update_values(
+                        initial_dates[indexjob], end_date)
+                    if changes:
+                        print('Refreshed %-40s... %d new values' %
+                              (indexjob, changes))
+                        pending.add(indexjob)
+
+                if pending:
+                    exporter = BatchExporter(
+                        [qcsvs[indexjob] for indexjob in sorted(pending)],
+                        SYMBOLS_DIR)
+                    exporter.export_to_file(FILENAME, clear_file=False,
+                                            only_new=True)
+
+                    cache.save()
+                    pending.clear()
+            except Exception as error:
+                print('Error refreshing %s: %s' %
+                      (', '.join(indexjobs), error))
+                jobs.enter(ERROR_REFRESH, 0, refresh, (indexjobs,))
+                return
+            finally:
+                print_timing()
+
+            # Jobs due at the same time are refreshed together
+            due = dict()
+            for indexjob in indexjobs:
+                interval = refresh_interval(INDEXES[indexjob][0])
+                due.setdefault(interval, list()).append(indexjob)
+
+            for interval, group in due.items():
+                jobs.enter(interval, 0, refresh, (group,))
+
+        jobs.enter(0, 0, refresh, (sorted(INDEXES),))
+
+        jobs.run()
+
+    # With --timing, the time spent in each stage is printed at the end (of
+    # each refresh, in daemon mode)
+    if '--timing' in argv[1:]:
+        stats = Stats()
+        Quote.instrument = QuickenCSV.instrument = \
+            BatchExporter.instrument = Instrument(stats)
+
+    # With --replay, responses of the web service are recorded and reused;
+    # with --offline, only recorded responses are used.  Requests cover the
+    # last days up to today, so --offline replays runs of the same day.
+    if '--replay' in argv[1:] or '--offline' in argv[1:]:
+        SGS.REPLAY_DIR = REPLAY_DIR
+        SGS.REPLAY_OFFLINE = '--offline' in argv[1:]
+
+    if '--daemon' in argv[1:]:
+        run_daemon()
+    else:
+        run_once()
+
+        print_timing()
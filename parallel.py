@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+from multiprocessing.pool import ThreadPool
+
+
+def parallel_map(func, items, max_workers=4):
+    '''
+    Apply a function to every item using a pool of threads.
+
+    Intended for I/O bound work (like web service requests), where most
+    of the time is spent waiting for the network.
+    @param func: Function called with each item.
+    @param items: Iterable with the items.
+    @param max_workers: Maximum number of items processed at the same time.
+                        If less than 2, items are processed sequentially.
+    @return: A list with the results, in the same order of "items".
+    @raise Exception: the first exception raised by "func", if any.
+    '''
+    items = list(items)
+    workers = min(max_workers, len(items))
+    if workers < 2:
+        return [func(item) for item in items]
+
+    pool = ThreadPool(workers)
+    try:
+        return pool.map(func, items, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
@@ -1,6 +1,14 @@
 # -*- coding: utf-8 -*-
 
+from bisect import bisect_left
 from csv import writer as csvwriter
+from datetime import date, datetime
+from os.path import exists
+import json
+
+from accumulator import accumulate, accumulated_symbol, window_sizes
+from instrumentation import NULL_STAGE
+from seriesdata import SeriesData
 
 
 class QuickenCSV(object):
@@ -22,61 +30,213 @@ class QuickenCSV(object):
         http://quicken.intuit.com/support/help/
         backup--restore--file-issues/
         how-to-import-historical-security-data-into-quicken/GEN82637.html
+
+    If "instrument" is set (see instrumentation.Instrument), downloading,
+    merging and exporting are measured, labeled by "name".
     '''
 
+    instrument = None
+
     def __init__(self, quote_source, accumulate_amount=1,
-                 accumulate_function='sum'):
+                 accumulate_function='sum', name=None):
         '''
         Constructor
+        @param accumulate_amount: Number of values accumulated in each
+                                  price, or a sequence of numbers to
+                                  export several accumulated symbols
+                                  (e.g. (3, 6, 12)).
+        @param accumulate_function: 'sum' or 'interest'.
+        @param name: Name of the object in measures.
         '''
         self.field_delimiter = ','
         self.quote_char = '"'
         self.decimal_sep = '.'
         self.date_format = '%x'  # use system locale
 
-        self.values = {}
+        self.values = SeriesData()
 
         self.accumulate_amount = accumulate_amount
         self.accumulate_func = accumulate_function
 
         self.data_source = quote_source
+        self.name = name or self.__class__.__name__
 
     def update_values(self, initial_date, final_date, clear_data=False):
-        new_values = self.data_source.get_values(initial_date, final_date)
-        if clear_data:
-            self.values = new_values
-        else:
-            self.values.update(new_values)
+        '''
+        Download the values of an interval of dates from the data source.
+        @param clear_data: If True, the values previously held are dropped.
+        @return: Number of values added or changed.
+        '''
+        with self.__instrumented('get_values') as record:
+            new_values = self.data_source.get_values(initial_date, final_date)
+            record.rows = len(new_values)
+
+        with self.__instrumented('merge', rows=len(new_values)):
+            if clear_data:
+                self.values = SeriesData(new_values)
+                return len(self.values)
+            else:
+                return self.values.update(new_values)
+
+    def export_to_file(self, target_file, clear_file=True, only_new=False):
+        '''
+        Export the values to a CSV file.
+
+        Values flow through accumulation, fixing and date formatting one
+        row at a time, so no intermediate copies of the data are built.
 
-    def export_to_file(self, target_file, clear_file=True):
+        The dates exported for each symbol are kept in an index file beside
+        the target (target file name plus '.idx'), so appending exports can
+        skip the rows the target already holds.
+
+        The accumulation windows are kept in a state file beside the
+        target (target file name plus '.acc'), by job name.  Exports with
+        "only_new" resume the windows of the job, so new accumulated
+        prices only need the values after the last accumulated date (see
+        accumulated_until).  Other exports accumulate from scratch.
+        @param target_file: Name of the file.
+        @param clear_file: If False, the values are appended to the file.
+        @param only_new: If True, only rows whose symbol and date are not
+                         in the file yet are appended.
+        @return: Number of lines written.
+        '''
         if len(self.values) == 0:
             return 0
 
-        with open(target_file, 'wb' if clear_file else 'ab') as f:
+        index_file = target_file + '.idx'
+        resume = not clear_file and exists(target_file)
+        exported = load_index(index_file) if resume else dict()
+
+        accumulating = window_sizes(self.accumulate_amount) != (1,)
+        if accumulating:
+            state_file = target_file + '.acc'
+            state = load_state(state_file)
+            if not (resume and only_new):
+                # Accumulate from scratch
+                state.pop(self.name, None)
+        else:
+            state = None
+
+        with self.__instrumented('export') as record, \
+                open(target_file, 'wb' if clear_file else 'ab') as f:
             csvfile = csvwriter(f, delimiter=self.field_delimiter,
                                 quotechar=self.quote_char)
 
-            data = [(qserie, qdate.strftime(self.date_format), qvalue)
-                     for (qserie, qdate), qvalue in
-                        sorted(self.values.items())]
+            data = self.rows(exported, only_new, state)
+            data = self.__format_dates(data)
 
-            if self.accumulate_amount > 1:
-                # Data must be accumulated
-                data = self.accumulate_data(data, self.accumulate_amount)
+            # write CSV
+            lines = 0
+            offset = f.tell()
+            for row in data:
+                csvfile.writerow(row)
+                lines += 1
 
-            data = self.fix_data(data)
+            record.rows = lines
+            record.bytes = f.tell() - offset
 
-            # write CSV
-            csvfile.writerows(data)
+        save_index(index_file, exported)
+        if accumulating:
+            save_state(state_file, state)
+
+        return lines
 
-            return len(data)
+    def rows(self, exported=None, only_new=False, state=None):
+        '''
+        Get the rows to export.  Values flow through accumulation and
+        fixing one row at a time.
+        @param exported: Dictionary with the dates exported of each symbol
+                         (see load_index), updated in place.  If None, rows
+                         are neither skipped nor tracked (see skip_exported
+                         and track_exported).
+        @param only_new: If True, rows whose date was already exported for
+                         their symbol are skipped.
+        @param state: Dictionary with the accumulation windows of all jobs
+                      (see load_state), updated in place.  The windows of
+                      this job (by name) are resumed.  If None, values are
+                      accumulated from scratch.
+        @return: A generator of tuples "symbol, date, price", grouped by
+                 symbol and sorted by date.
+        '''
+        data = self.values.rows()
+
+        sizes = window_sizes(self.accumulate_amount)
+        if sizes != (1,):
+            # Data must be accumulated
+            if state is None:
+                state = dict()
+            job_state = state.setdefault(self.name, dict())
+
+            # Windows of symbols or sizes no longer exported are dropped
+            expected = set(accumulated_symbol(symbol, size)
+                           for symbol in self.values.symbols()
+                           for size in sizes)
+            for acc_symbol in list(job_state):
+                if acc_symbol not in expected:
+                    del job_state[acc_symbol]
+
+            data = accumulate(data, self.accumulate_amount,
+                              self.accumulate_func, job_state)
+
+        data = self.__fix_rows(data)
+
+        if exported is None:
+            return data
+        if only_new:
+            return skip_exported(data, exported)
+        return track_exported(data, exported)
+
+    def accumulated_until(self, target_file, symbols):
+        '''
+        Get how far the accumulation windows of this job (by name) go in
+        the state file of a target, so appending exports only need the
+        values after it.
+        @param target_file: Name of the target file.
+        @param symbols: Symbols of the job (before accumulation).  Windows
+                        are only resumed if every symbol has windows of
+                        every size of "accumulate_amount".
+        @return: The earliest last date of the windows of the job or None
+                 if there are no windows to resume (or some are missing,
+                 e.g. a symbol or window size was added to the job).
+        '''
+        if not exists(target_file):
+            return None
+
+        job_state = load_state(target_file + '.acc').get(self.name) or {}
+        acc_symbols = [accumulated_symbol(symbol, size)
+                       for symbol in symbols
+                       for size in window_sizes(self.accumulate_amount)]
+        if not acc_symbols or \
+                any(acc_symbol not in job_state for acc_symbol in acc_symbols):
+            return None
+
+        return min(job_state[acc_symbol][0] for acc_symbol in acc_symbols)
+
+    def __instrumented(self, stage, **counts):
+        '''
+        Measure a stage (see Quote.instrumented).
+        '''
+        if self.instrument is None:
+            return NULL_STAGE
+        return self.instrument.stage(self.name, stage, **counts)
 
     def export(self, clear_file=True):
         filename = self.data_source.get_unique_ID() + '.csv'
         return self.export_to_file(filename, clear_file)
 
     def fix_data(self, data):
-        new_data = list()
+        '''
+        Fix prices that Quicken can not import.
+        @param data: Iterable of tuples "symbol, date, price".
+        @return: A list with the fixed tuples.
+        '''
+        return list(self.__fix_rows(data))
+
+    def __fix_rows(self, data):
+        '''
+        Generator version of fix_data.
+        @see: fix_data
+        '''
         for symbol, date, price in data:
 
             try:
@@ -86,41 +246,167 @@ class QuickenCSV(object):
                 if float(price) < 0.000001:
                     price = '0.00000001'
 
-                new_data.append((symbol, date, price))
+                yield symbol, date, price
             except TypeError:
                 # Price is not numeric (probably 'None'),
                 # so just ignore this value.
                 pass
 
-        return new_data
+    def __format_dates(self, data):
+        '''
+        Format the dates of the rows according to "date_format".  Each
+        distinct date is formatted only once.
+        @param data: Iterable of tuples "symbol, date, price".
+        @return: A generator of tuples "symbol, formatted date, price".
+        '''
+        formatted = dict()
+        for symbol, date, price in data:
+            str_date = formatted.get(date)
+            if str_date is None:
+                str_date = formatted[date] = date.strftime(self.date_format)
+
+            yield symbol, str_date, price
 
     def accumulate_data(self, data, num):
-        acc_func_name = 'accumulate_{0}'.format(self.accumulate_func)
-        acc_func = getattr(self, acc_func_name, None)
+        '''
+        Accumulate the prices of each symbol over sliding windows.
+        @param data: List of tuples "symbol, date, price" sorted by symbol
+                     and date.
+        @param num: Window size or a sequence of window sizes.
+        @return: A list of tuples "symbol-ACx, date, accumulated price".
+        @see: accumulator.accumulate
+        '''
+        return list(accumulate(data, num, self.accumulate_func))
 
-        if acc_func is not None:
-            new_data = list()
-            for i in range(num - 1, len(data)):
-                acc_value = acc_func([float(price)
-                                      for _, _, price in
-                                      data[i - num + 1:i + 1]])
 
-                # Symbol and date information matches the last item
-                # in the interval suffixed by "-ACx"
-                # where 'x' is the accumulated amount
-                symbol, date, _ = data[i]
-                symbol = '{0}-AC{1}'.format(symbol, num)
+def load_index(index_file):
+    '''
+    Load the index of exported dates of a target file.
+
+    The dates of each symbol are kept as spans of consecutive days, so the
+    index stays small while still telling exactly which dates are in the
+    target.  Index files of older versions, with only the last date of
+    each symbol, are read as all dates up to it.
+    @return: A dictionary "symbol: sorted list of [initial, final] date
+             ordinals".
+    '''
+    if not exists(index_file):
+        return dict()
 
-                new_data.append((symbol, date, acc_value))
+    with open(index_file, 'rb') as f:
+        index = json.load(f)
 
-            return new_data
+    exported = dict()
+    for symbol, spans in index.items():
+        if isinstance(spans, basestring):
+            # Last date exported
+            exported[symbol] = [[1, parse_iso_date(spans).toordinal()]]
         else:
-            msg = "Unknown accumulate function named '{0}'."
-            raise Exception(msg.format(self.accumulate_func))
+            exported[symbol] = [[parse_iso_date(ini).toordinal(),
+                                 parse_iso_date(end).toordinal()]
+                                for ini, end in spans]
+
+    return exported
+
+
+def save_index(index_file, exported):
+    '''
+    Save the index of exported dates of a target file.
+    @param exported: A dictionary "symbol: sorted list of [initial, final]
+                     date ordinals".
+    '''
+    fromordinal = date.fromordinal
+    with open(index_file, 'wb') as f:
+        json.dump(dict((symbol, [(fromordinal(ini).isoformat(),
+                                  fromordinal(end).isoformat())
+                                 for ini, end in spans])
+                       for symbol, spans in exported.items()),
+                  f, sort_keys=True)
+
+
+def add_exported(spans, ordinal):
+    '''
+    Add a date to the exported spans of a symbol, merging adjacent spans.
+    @param spans: Sorted list of [initial, final] date ordinals, updated in
+                  place.
+    @return: False if the date was already exported, True otherwise.
+    '''
+    # Index of the first span starting after the date
+    index = bisect_left(spans, [ordinal + 1])
+
+    if index > 0 and spans[index - 1][1] >= ordinal:
+        return False
+
+    if index > 0 and spans[index - 1][1] == ordinal - 1:
+        spans[index - 1][1] = ordinal
+        if index < len(spans) and spans[index][0] == ordinal + 1:
+            spans[index - 1][1] = spans[index][1]
+            del spans[index]
+    elif index < len(spans) and spans[index][0] == ordinal + 1:
+        spans[index][0] = ordinal
+    else:
+        spans.insert(index, [ordinal, ordinal])
+
+    return True
+
+
+def load_state(state_file):
+    '''
+    Load the accumulation windows of all jobs of a target file.
+    @return: A dictionary "job name: {symbol-ACx: (last date, window
+             values)}".
+    '''
+    if not exists(state_file):
+        return dict()
+
+    with open(state_file, 'rb') as f:
+        state = json.load(f)
+
+    return dict((name, dict((symbol, (parse_iso_date(str_date), values))
+                            for symbol, (str_date, values) in
+                                windows.items()))
+                for name, windows in state.items())
+
+
+def save_state(state_file, state):
+    '''
+    Save the accumulation windows of all jobs of a target file.
+    @param state: A dictionary "job name: {symbol-ACx: (last date, window
+                  values)}".
+    '''
+    with open(state_file, 'wb') as f:
+        json.dump(dict((name, dict((symbol, (qdate.isoformat(), values))
+                                   for symbol, (qdate, values) in
+                                       windows.items()))
+                       for name, windows in state.items()),
+                  f, indent=0, sort_keys=True)
+
+
+def track_exported(data, exported):
+    '''
+    Record the dates of the rows as exported.
+    @param exported: A dictionary "symbol: spans" (see load_index) updated
+                     in place.
+    @return: A generator with the same rows.
+    '''
+    for symbol, date, price in data:
+        add_exported(exported.setdefault(symbol, list()), date.toordinal())
+
+        yield symbol, date, price
+
+
+def skip_exported(data, exported):
+    '''
+    Skip the rows whose date was already exported for their symbol.
+    @param exported: A dictionary "symbol: spans" (see load_index) updated
+                     in place.
+    @return: A generator with the new rows.
+    '''
+    for symbol, date, price in data:
+        if add_exported(exported.setdefault(symbol, list()),
+                        date.toordinal()):
+            yield symbol, date, price
 
-    def accumulate_interest(self, data_interval):
-        product = reduce(lambda i, j: i * (1 + j / 100), data_interval, 1)
-        return (product - 1) * 100
 
-    def accumulate_sum(self, data_interval):
-        return sum(data_interval)
+def parse_iso_date(str_date):
+    return datetime.strptime(str_date, '%Y-%m-%d').date()
@@ -1,13 +1,27 @@
+from instrumentation import NULL_STAGE
+
+
 class Quote(object):
     '''
     Abstract base class for quote downloading.
+
+    Unique IDs are prefixed by PREFIX, or by the class name if it is None,
+    so different classes accessing the same data can share their IDs.
+
+    If "instrument" is set (see instrumentation.Instrument), the stages
+    of all sources (requests, result building, etc.) are measured,
+    labeled by "label" or, if it is None, by the prefix.
     '''
 
+    PREFIX = None
+    instrument = None
+    label = None
+
     def __init__(self):
         '''
         Constructor
         '''
-        self.__prefix = self.__class__.__name__.upper()
+        self.__prefix = self.PREFIX or self.__class__.__name__.upper()
 
     def get_last_value(self):
         '''
@@ -33,6 +47,19 @@ class Quote(object):
         '''
         raise NotImplementedError()
 
+    def instrumented(self, stage, **counts):
+        '''
+        Measure a stage of the source.
+        @param stage: Name of the stage.
+        @param counts: Initial number of requests, rows and bytes.
+        @return: A context manager returning the record of the stage, where
+                 requests, rows and bytes can be set.
+        '''
+        if self.instrument is None:
+            return NULL_STAGE
+        return self.instrument.stage(self.label or self.__prefix, stage,
+                                     **counts)
+
     def build_ID(self, serie):
         '''
         Build an unique ID based on quote number.
@@ -1,7 +1,19 @@
 # -*- coding: utf-8 -*-
 
-from quote import Quote
+from datetime import date, datetime, timedelta
+from HTMLParser import HTMLParser
+from httplib import HTTPException
+from os import makedirs, remove, rename
+from os.path import exists, join
+from tempfile import gettempdir
 from urllib import urlencode
+from urllib2 import urlopen
+# Pages are parsed in threads, and the first datetime.strptime call is not
+# thread safe (it imports _strptime)
+import _strptime
+
+from parallel import parallel_map
+from quote import Quote
 
 
 class GF(Quote):
@@ -22,13 +34,26 @@ class GF(Quote):
     new ID to it.  Be aware to also rename your downloaded quotes
     case this happens.
 
+    Long intervals are requested as one history page per year, all at the
+    same time (up to "max_workers" requests).  Pages of years ended more
+    than SETTLE_DAYS days ago do not change anymore (late quotes are
+    published by then), so they are kept in CACHE_DIR (the system
+    temporary directory if None) and never downloaded again.  Pages
+    without quotes (like maintenance pages) are never kept.
+
     Geração Futuro website:
         http://www.gerafuturo.com.br/
     '''
 
-    def __init__(self, fund_id):
+    CACHE_DIR = None
+    SETTLE_DAYS = 45
+
+    def __init__(self, fund_id, max_workers=4):
         '''
         Constructor
+        @param fund_id: ID of the fund in the portal.
+        @param max_workers: Maximum number of page requests at the same
+                            time.
         '''
         super(GF, self).__init__()
 
@@ -36,21 +61,80 @@ class GF(Quote):
         self.fund_page = 'produtos.resultado_historico_cotas'
         self.portal_url = 'https://online.gerafuturo.com.br/onlineGeracao/' \
                           'PortalManager'
+        self.max_workers = max_workers
+
+    def get_last_value(self):
+        '''
+        Get last available value for the fund.
+        @return: A dictionary "ticker, date: quotation" with the last value
+                 (empty if there is none).
+        '''
+        today = date.today()
+        values = self.get_values(date(today.year - 1, 1, 1), today)
+        if not values:
+            return dict()
+
+        last = max(values)
+        return {last: values[last]}
+
+    def get_value(self, at_date):
+        '''
+        Get the quotation of the fund for a specific date.
+        Short call to get_values(at_date, at_date).
+        @see: get_values
+        '''
+        return self.get_values(at_date, at_date)
+
+    def get_values(self, initial_date, final_date):
+        '''
+        Get all quotations available for the fund in a interval of dates.
+        Years whose page can not be downloaded are ignored.
+        @return: A dictionary "ticker, date: quotation" with all values
+            retrieved.
+        '''
+        years = range(initial_date.year, final_date.year + 1)
 
-    def getLastValue(self):
-        # FIXME: must implement
-        raise NotImplementedError()
+        with self.instrumented('get_pages') as record:
+            pages = parallel_map(self.__year_prices, years, self.max_workers)
+            record.requests = len(years)
 
-    def getValue(self, at_date):
-        # FIXME: must implement
-        raise NotImplementedError()
+        ticker = self.build_ID(self.fund_id)
+        return dict(((ticker, qdate), price)
+                    for prices in pages if prices is not None
+                    for qdate, price in prices
+                    if initial_date <= qdate <= final_date)
 
-    def getValues(self, initial_date, final_date):
-        # FIXME: must implement
+    # Names used before the Quote interface
+    getLastValue = get_last_value
+    getValue = get_value
+    getValues = get_values
 
-        # detect years based on dates
+    def __year_prices(self, year):
+        '''
+        Get the prices of a whole year, from the page cache if possible.
+        @return: A list of tuples "date, price" or None if the page can not
+                 be downloaded.
+        '''
+        today = date.today()
+        final_date = date(year, 12, 31)
 
-        raise NotImplementedError()
+        cache_file = None
+        if final_date < today - timedelta(days=self.SETTLE_DAYS):
+            cache_dir = self.CACHE_DIR or join(gettempdir(), 'gf')
+            if not exists(cache_dir):
+                makedirs(cache_dir)
+            cache_file = join(cache_dir,
+                              '{0}_{1}.html'.format(self.fund_id, year))
+
+            if exists(cache_file):
+                with open(cache_file, 'rb') as f:
+                    return parse_history(f)
+
+        try:
+            return self.__download_page(self.fund_id, date(year, 1, 1),
+                                        min(final_date, today), cache_file)
+        except (IOError, HTTPException):
+            return None
 
     def __buildURL(self, page, params):
         # 'show' must always be the first parameter
@@ -58,22 +142,103 @@ class GF(Quote):
         str_params = urlencode(params)
         return self.portal_url + '?show=' + page + '&' + str_params
 
-    def __download_page(self, fund_id, initial_date, final_date):
-
-        #parser = GFParser()
-
+    def __download_page(self, fund_id, initial_date, final_date,
+                        cache_file=None):
+        '''
+        Download and parse the history page of a fund.
+        @param cache_file: If not None, the page is also saved on it,
+                           unless it has no quotes.
+        @return: A list of tuples "date, price".
+        @raise IOError: if the page can not be downloaded.
+        @raise HTTPException: if the server answer is invalid.
+        '''
         params = dict()
         params['id_fundo_clube'] = str(fund_id)
         params['busca'] = 's'
         params['dataInicio'] = initial_date.strftime('%d/%m/%Y')
         params['dataFim'] = final_date.strftime('%d/%m/%Y')
 
+        response = urlopen(self.__buildURL(self.fund_page, params))
+        try:
+            if cache_file is None:
+                return parse_history(response)
+
+            # Saved as it is parsed, but only kept when complete
+            with open(cache_file + '.tmp', 'wb') as f:
+                prices = parse_history(response, f)
+
+            if prices:
+                rename(cache_file + '.tmp', cache_file)
+            else:
+                remove(cache_file + '.tmp')
+            return prices
+        finally:
+            response.close()
+
+
+class GFParser(HTMLParser):
+    '''
+    Parser of the history page of a fund.
+
+    Quotes are the table rows whose first cell is a date (as "dd/mm/yyyy")
+    and whose second cell is a number (as "1.234,56"); other rows are
+    ignored.  Rows are parsed as the page is fed, so the page is never
+    held in memory.
+    '''
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.prices = list()
+
+        self.__cells = None  # cells of the current row
+        self.__text = None  # text of the current cell
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'tr':
+            self.__cells = list()
+        elif tag in ('td', 'th') and self.__cells is not None:
+            self.__text = list()
+
+    def handle_endtag(self, tag):
+        if tag in ('td', 'th') and self.__text is not None:
+            self.__cells.append(''.join(self.__text).strip())
+            self.__text = None
+        elif tag == 'tr' and self.__cells is not None:
+            self.__add_row(self.__cells)
+            self.__cells = None
+
+    def handle_data(self, data):
+        if self.__text is not None:
+            self.__text.append(data)
+
+    def __add_row(self, cells):
+        if len(cells) < 2:
+            return
+
         try:
-            raise NotImplementedError
-            #parser.getPage(self.fundpage, params)
-            #prices = parser.parsePage()
-            #self.prices.update(prices)
-
-            #return True
-        except NotImplementedError:
-            return False
+            qdate = datetime.strptime(cells[0], '%d/%m/%Y').date()
+            price = float(cells[1].replace('.', '').replace(',', '.'))
+        except ValueError:
+            return  # not a quote (e.g. the header)
+
+        self.prices.append((qdate, price))
+
+
+def parse_history(page, copy=None, chunk_size=8192):
+    '''
+    Parse the history page of a fund, reading it by chunks.
+    @param page: File-like object with the page.
+    @param copy: If not None, a file where the page is also written.
+    @return: A list of tuples "date, price" (see GFParser).
+    '''
+    parser = GFParser()
+    while True:
+        chunk = page.read(chunk_size)
+        if not chunk:
+            break
+        if copy is not None:
+            copy.write(chunk)
+        parser.feed(chunk)
+    parser.close()
+
+    return parser.prices
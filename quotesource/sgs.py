@@ -1,10 +1,20 @@
 # -*- coding: utf-8 -*-
 
-from datetime import date
+from contextlib import contextmanager
+from datetime import date, timedelta
+from threading import Lock
+from time import sleep
 from urllib2 import getproxies
 from suds import client, WebFault
+from suds.cache import ObjectCache
+from suds.transport import TransportError
 
+from businessdays import BRAZIL
+from parallel import parallel_map
 from quote import Quote
+from quotesource.soapreplay import ReplayTransport, ResponseStore
+from quotesource.soaptransport import MeasuredTransport
+from quotesource.sgsxml import iter_xml_values
 
 
 class SGS(Quote):
@@ -60,46 +70,183 @@ class SGS(Quote):
                     oidSerie: integer
                     svalor: string
                     valor: string
+
+    The service is accessed through WSDL_URL, which can be changed to use
+    another server (like a local one for tests).
+
+    SOAP clients are kept in a pool shared by all objects.  Each request
+    takes a client of the pool for itself, so requests made at the same
+    time (by several threads) never share a client: suds clients, and
+    their clones, are not thread safe.  The parsed WSDL is kept in a disk
+    cache at WSDL_CACHE_DIR (the system temporary directory if None) for
+    WSDL_CACHE_DAYS days, so it is downloaded and parsed only once per
+    machine, and new clients are built from it.
+
+    If REPLAY_DIR is set, raw responses of the service are recorded there
+    (compressed) and identical requests are answered from the records:
+    responses about closed historical ranges forever, others for
+    REPLAY_TTL seconds.  With REPLAY_OFFLINE, only recorded responses are
+    used and the service is never accessed; requests not recorded fail as
+    if the service was unavailable.  Only requests with exactly the same
+    arguments (including dates) are replayed (see
+    soapreplay.ReplayTransport).
+
+    With instrumentation (see Quote.instrumented), each call of the web
+    service is measured by its operation name, and its round trip alone
+    (with the size of the response) by "soap_send" (see
+    soaptransport.MeasuredTransport), so the time suds takes building the
+    request and deserializing the response is the difference between
+    both.  Replayed responses are not measured by "soap_send".
     '''
 
-    def __init__(self, series):
+    WSDL_URL = 'https://www3.bcb.gov.br/sgspub/JSP/sgsgeral/' \
+               'FachadaWSSGS.wsdl'
+    WSDL_CACHE_DIR = None
+    WSDL_CACHE_DAYS = 7
+    RETRY_DELAY = 5  # seconds, multiplied by the attempt number
+
+    REPLAY_DIR = None
+    REPLAY_TTL = 60 * 60  # seconds
+    REPLAY_OFFLINE = False
+
+    # Minimum number of days between probes of the last value of a series,
+    # by periodicity.  None means the series is never probed (probing a
+    # daily series costs more than downloading its new values).
+    PROBE_INTERVALS = {'D': None, 'M': 1, 'T': 7, 'S': 7, 'A': 30}
+
+    # Number of months of each period, by periodicity
+    PERIOD_MONTHS = {'M': 1, 'T': 3, 'S': 6, 'A': 12}
+
+    # Business days of the series given as "business_series"
+    CALENDAR = BRAZIL
+
+    __idle_soap = dict()  # (WSDL URL, replay settings): idle clients
+    __idle_soap_lock = Lock()
+    __build_lock = Lock()
+
+    def __init__(self, series, cache=None, xml=False, max_workers=4,
+                 probe=False, business_series=()):
         '''
         Constructor of the class.
         @param serie: Serie number to access.
+        @param cache: A SeriesCache used to avoid downloading values
+                      already fetched.  If None, all values are always
+                      downloaded.
+        @param xml: If True, values are requested as XML and parsed
+                    directly, instead of being deserialized into
+                    WSSerieVO objects.  Much faster for large requests.
+        @param max_workers: Maximum number of requests at the same time,
+                            for functions requesting each series apart
+                            (like get_last_value).
+        @param probe: If True (and there is a cache), the last value of
+                      the series is probed first, and only series with
+                      values newer than the cache are downloaded.
+        @param business_series: Series published on every business day
+                                (of CALENDAR) and only on them.  Requests
+                                of these series skip weekends and
+                                holidays, and recent business days
+                                without values are downloaded again.
         '''
         super(SGS, self).__init__()
 
         # SOAP constant settings
-        self.__SGS_URL = 'https://www3.bcb.gov.br/sgspub/JSP/sgsgeral/' \
-                         'FachadaWSSGS.wsdl'
+        self.__SGS_URL = self.WSDL_URL
         self.__XML_ENCODING = 'ISO-8859-1'
         self.__DATE_FORMAT = '%d/%m/%Y'
 
         self.__series = series
-        self.__soap = None
+        self.__cache = cache
+        self.__xml = xml
+        self.max_workers = max_workers
+        self.probe = probe
+        self.__business_series = frozenset(business_series)
+
+    @contextmanager
+    def __soap_client(self):
+        '''
+        Take a SOAP client of the pool for a request, building a new one if
+        all clients are in use.  The client is returned to the pool after
+        the request.
+        @return: A context manager giving a suds client.
+        @raise WebFault: if the service is unavailable for some reason.
+        '''
+        key = (self.__SGS_URL, SGS.REPLAY_DIR, SGS.REPLAY_TTL,
+               SGS.REPLAY_OFFLINE)
+
+        with SGS.__idle_soap_lock:
+            idle = SGS.__idle_soap.setdefault(key, list())
+            soap = idle.pop() if idle else None
+
+        if soap is None:
+            with self.instrumented('soap_init'):
+                soap = SGS.__build_soap_client(self.__SGS_URL)
 
-    def __soap_init(self):
+        # Round trips are measured as stages of this object
+        soap.options.transport.source = self
+        try:
+            yield soap
+        finally:
+            soap.options.transport.source = None
+            with SGS.__idle_soap_lock:
+                SGS.__idle_soap[key].append(soap)
+
+    @staticmethod
+    def __build_soap_client(url):
+        '''
+        Build a new SOAP client, independent of all others.
+        @param url: URL of the WSDL.
+        @return: A suds client.
+        @raise WebFault: if the service is unavailable for some reason.
         '''
-        Initializes the SOAP client if it is not already initialized.
-        @return: nothing.
+        wsdl_cache = ObjectCache(SGS.WSDL_CACHE_DIR, days=SGS.WSDL_CACHE_DAYS)
+
+        # Only one client is built at a time, so the WSDL is parsed once
+        # and the next clients read it from the disk cache
+        with SGS.__build_lock:
+            if SGS.REPLAY_DIR is None:
+                transport = MeasuredTransport(proxy=getproxies())
+                return client.Client(url, cache=wsdl_cache,
+                                     transport=transport)
+
+            transport = ReplayTransport(
+                ResponseStore(SGS.REPLAY_DIR), SGS.REPLAY_OFFLINE,
+                SGS.REPLAY_TTL, proxy=getproxies())
+            return client.Client(url, cache=wsdl_cache, transport=transport)
+
+    def __soap_fan_out(self, operation, *arguments):
+        '''
+        Call a web service function once for each series, at the same time
+        (up to "max_workers" calls).  Each call takes its own client of the
+        pool, and a failure of one series does not affect the others.
+        @param operation: Name of the web service function.
+        @param arguments: Arguments passed after the series number.
+        @return: A list with the values returned, in the same order of
+                 "series".  The value of series whose call failed is None.
         @raise WebFault: if the service is unavailable for some reason.
         '''
-        if not self.__soap:
-            self.__soap = client.Client(self.__SGS_URL, proxy=getproxies())
+        def call(serie):
+            with self.__soap_client() as soap:
+                webfunc = getattr(soap.service, operation)
+                try:
+                    return webfunc(serie, *arguments)
+                except WebFault:
+                    return None
+
+        with self.instrumented(operation, requests=len(self.__series)):
+            return parallel_map(call, self.__series, self.max_workers)
 
     def __soap_get_value(self, at_date):
         '''
         Wrapper for "getValor" web service function that request a single
         value from a specified date.
         @return: A list of WSValorSerieVO values.  The list is guaranteed
-                 to be in the same order of "series" parameter.
+                 to be in the same order of "series" parameter.  The value
+                 of series whose request failed is None.
         @raise WebFault: if the service is unavailable for some reason.
         '''
-        self.__soap_init()
         str_date = at_date.strftime(self.__DATE_FORMAT)
 
-        return [self.__soap.service.getValor(serie, str_date)
-                       for serie in self.__series]
+        return self.__soap_fan_out('getValor', str_date)
 
     def __soap_get_value2(self, initial_date, final_date):
         '''
@@ -109,16 +256,15 @@ class SGS(Quote):
         date.  It should not be confused with functions to get several quotes
         of a interval of dates (equivalent of several calls to get_value).
         @return: A list of WSValorSerieVO values. The list is guaranteed to be
-                 in the same order of "series" parameter.
+                 in the same order of "series" parameter.  The value of
+                 series whose request failed is None.
         @raise WebFault: if the service is unavailable for some reason.
         '''
-        self.__soap_init()
         str_ini_date = initial_date.strftime(self.__DATE_FORMAT)
         str_fin_date = final_date.strftime(self.__DATE_FORMAT)
 
-        return [self.__soap.service.getValorEspecial(serie,
-                                                    str_ini_date, str_fin_date)
-                                                    for serie in self.__series]
+        return self.__soap_fan_out('getValorEspecial',
+                                   str_ini_date, str_fin_date)
 
     def __soap_get_last_value(self, xml=False):
         '''
@@ -130,48 +276,54 @@ class SGS(Quote):
                     WSValorSerieVO object.
         @return: A list of WSValorSerieVO values or a list of XML strings.
                  The list is guaranteed to be in the same order of "series"
-                 parameter.
+                 parameter.  The value of series whose request failed is
+                 None.
         @raise WebFault: if the service is unavailable for some reason.
         '''
-        self.__soap_init()
         if xml:
-            webfunc = self.__soap.service.getUltimoValorXML
-        else:
-            webfunc = self.__soap.service.getUltimoValorVO
-
-        ret_values = [webfunc(serie) for serie in self.__series]
+            ret_values = self.__soap_fan_out('getUltimoValorXML')
 
-        # Encode XML string according to its encoding
-        if xml:
-            ret_values = [ret_value.encode(self.__XML_ENCODING)
-                            for ret_value in ret_values]
+            # Encode XML string according to its encoding
+            ret_values = [ret_value and ret_value.encode(self.__XML_ENCODING)
+                          for ret_value in ret_values]
+        else:
+            ret_values = self.__soap_fan_out('getUltimoValorVO')
 
         return ret_values
 
-    def __soap_get_values(self, initial_date, final_date, xml=False):
+    def __soap_get_values(self, initial_date, final_date, xml=False,
+                          series=None):
         '''
         Wrapper for "getValoresSeriesVO" and "getValoresSeriesXML" web service
         functions that request the values from a interval of dates.  The
         control of which function to use is determined by xml parameter.
         @param xml: if True, the result is a XML string instead of a
                     list of WSSerieVO objects.
+        @param series: list of series to request.  If None, all series
+                       of the object are requested.
         @return: A list of WSSerieVO objects holding all WSValorSerieVO values
                  or an XML string with the values of all series.
         @raise WebFault: if the service is unavailable for some reason.
         '''
-        self.__soap_init()
         str_ini_date = initial_date.strftime(self.__DATE_FORMAT)
         str_fin_date = final_date.strftime(self.__DATE_FORMAT)
         if xml:
-            webfunc = self.__soap.service.getValoresSeriesXML
+            operation = 'getValoresSeriesXML'
         else:
-            webfunc = self.__soap.service.getValoresSeriesVO
+            operation = 'getValoresSeriesVO'
 
-        ret_value = webfunc(self.__series, str_ini_date, str_fin_date)
+        if series is None:
+            series = self.__series
 
-        # Encode XML string according to its encoding
-        if xml:
-            ret_value.encode(self.__XML_ENCODING)
+        with self.__soap_client() as soap, \
+                self.instrumented(operation, requests=1) as record:
+            webfunc = getattr(soap.service, operation)
+            ret_value = webfunc(series, str_ini_date, str_fin_date)
+
+            # Encode XML string according to its encoding
+            if xml:
+                ret_value = ret_value.encode(self.__XML_ENCODING)
+                record.bytes = len(ret_value)
 
         return ret_value
 
@@ -185,8 +337,10 @@ class SGS(Quote):
             last_values = self.__soap_get_last_value(xml=False)
 
             # Convert array of WSSerieVO in an array of WSValorSerieVO.
-            # All none "None" values are removed from the array
-            last_values = [x.ultimoValor for x in last_values if x.ultimoValor]
+            # All none "None" values (and failed series) are removed from
+            # the array
+            last_values = [x.ultimoValor for x in last_values
+                           if x and x.ultimoValor]
         except WebFault:
             return list()
 
@@ -209,16 +363,307 @@ class SGS(Quote):
             retrieved.
         '''
         try:
-            data = self.__soap_get_values(initial_date, final_date, xml=False)
-
-            # Flattening WSValorSerieVO array inside WSSerieVO in a single
-            # list of WSValorSerieVO (that is, joining all series together)
-            data = [entry for serie in data for entry in serie.valores]
+            return self.__fetch_values(initial_date, final_date)
         except WebFault:
             return list()
 
+    def backfill(self, initial_date, final_date, chunk_days=365,
+                 max_workers=4, retries=3):
+        '''
+        Get all quotations available for the quotes in a long interval of
+        dates, like a full history.
+
+        The interval is split in chunks of "chunk_days" days, downloaded at
+        the same time.  A chunk that fails is retried alone, so a timeout
+        does not waste the other chunks; unlike get_values, a chunk that
+        still fails after all retries raises an error instead of silently
+        returning no values.
+
+        A series without values in a chunk, but with values in chunks
+        before and after it, may have lost them.  If a value must be dated
+        in the chunk (according to the business days of the series or its
+        periodicity, when known from a probe), the chunk is downloaded
+        again (bypassing the cache) for that series up to "retries" times,
+        and an error is raised if it still has no values.  If that is not
+        known, the chunk is downloaded again once and accepted as it is.
+        Chunks where no value can be dated (like a weekend for a business
+        series) are accepted empty.
+        @param chunk_days: Number of days of each request.
+        @param max_workers: Maximum number of requests at the same time.
+        @param retries: Number of attempts for each chunk.
+        @return: A dictionary "ticker, date: quotation" with all values
+            retrieved.
+        @raise WebFault: if a chunk fails after all retries.
+        @raise TransportError: if a chunk fails after all retries.
+        @raise IOError: if a chunk has no values after all retries, but
+                        must have.
+        '''
+        chunks = list()
+        chunk_ini = initial_date
+        while chunk_ini <= final_date:
+            chunk_end = min(chunk_ini + timedelta(days=chunk_days - 1),
+                            final_date)
+            chunks.append((chunk_ini, chunk_end))
+            chunk_ini = chunk_end + timedelta(days=1)
+
+        def download(chunk, series=None, cache=self.__cache):
+            # Each chunk has its own object (and each request its own SOAP
+            # client)
+            source = SGS(series or self.__series, cache, self.__xml,
+                         probe=self.probe,
+                         business_series=self.__business_series)
+            source.label = self.label
+            for attempt in range(1, retries + 1):
+                try:
+                    return source.__fetch_values(*chunk)
+                except (WebFault, TransportError, IOError):
+                    if attempt == retries:
+                        raise
+                    sleep(self.RETRY_DELAY * attempt)
+
+        chunk_values = parallel_map(download, chunks, max_workers)
+
+        tickers = [set(ticker for ticker, _ in values)
+                   for values in chunk_values]
+        for index, chunk in enumerate(chunks):
+            lost = [serie for serie in self.__series
+                    if self.__lost(self.build_ID(serie), tickers, index)]
+
+            # Series that can not have values in the chunk are not retried
+            expected = dict((serie, self.__expects_values(serie, *chunk))
+                            for serie in lost)
+            lost = [serie for serie in lost if expected[serie] is not False]
+            required = [serie for serie in lost if expected[serie]]
+
+            for attempt in range(1, (retries if required else 1) + 1):
+                if not lost:
+                    break
+                if attempt > 1:
+                    sleep(self.RETRY_DELAY * (attempt - 1))
+
+                values = download(chunk, lost, None)
+                chunk_values[index].update(values)
+                found = set(ticker for ticker, _ in values)
+                for serie in lost:
+                    ticker = self.build_ID(serie)
+                    if ticker in found and self.__cache is not None:
+                        self.__cache.store(serie, chunk[0], chunk[1], dict(
+                            (qdate, qvalue)
+                            for (value_ticker, qdate), qvalue in
+                                values.items() if value_ticker == ticker))
+                lost = [serie for serie in lost
+                        if self.build_ID(serie) not in found]
+                required = [serie for serie in required if serie in lost]
+
+            if required:
+                msg = 'No values for series {0} from {1} to {2}.'
+                raise IOError(msg.format(', '.join(map(str, required)),
+                                         *chunk))
+
+        result = dict()
+        for values in chunk_values:
+            result.update(values)
+
+        return result
+
+    @staticmethod
+    def __lost(ticker, tickers, index):
+        '''
+        @param tickers: List with the set of tickers found in each chunk.
+        @return: True if a ticker has values in chunks before and after a
+                 chunk, but not in it.
+        '''
+        return ticker not in tickers[index] and \
+            any(ticker in found for found in tickers[:index]) and \
+            any(ticker in found for found in tickers[index + 1:])
+
+    def __expects_values(self, serie, initial_date, final_date):
+        '''
+        Tell if a series must have values in an interval of dates,
+        according to its business days or to its periodicity (if known
+        from a probe).
+        @return: True if a value must be dated in the interval, False if
+                 none can be, or None if it is not known.
+        '''
+        calendar = self.__calendar(serie, initial_date, final_date)
+        if calendar is not None:
+            return calendar.count(initial_date, final_date) > 0
+
+        info = self.__cache.probe_info(serie) \
+            if self.__cache is not None else None
+        months = self.PERIOD_MONTHS.get(info[2]) if info else None
+        if months is None:
+            return None
+
+        # Values of periodic series are dated on the first day of their
+        # periods (periods start on January)
+        year, month = initial_date.year, initial_date.month
+        if initial_date.day > 1:
+            year, month = year + month // 12, month % 12 + 1
+        while date(year, month, 1) <= final_date:
+            if (month - 1) % months == 0:
+                return True
+            year, month = year + month // 12, month % 12 + 1
+        return False
+
+    def __fetch_values(self, initial_date, final_date):
+        '''
+        Same as get_values, but failures are raised.
+        @see: get_values
+        @raise WebFault: if the service is unavailable for some reason.
+        '''
+        if self.__cache is not None:
+            return self.__fetch_cached_values(initial_date, final_date)
+
+        if self.__xml:
+            data = self.__soap_get_values(initial_date, final_date, xml=True)
+            return self.__build_result_xml(data)
+
+        data = self.__soap_get_values(initial_date, final_date, xml=False)
+
+        # Flattening WSValorSerieVO array inside WSSerieVO in a single
+        # list of WSValorSerieVO (that is, joining all series together)
+        data = [entry for serie in data for entry in serie.valores]
+
         return self.__build_result(data)
 
+    def __fetch_cached_values(self, initial_date, final_date):
+        '''
+        Get all quotations available for the quotes in a interval of
+        dates, downloading only the intervals missing in the cache.
+        Series with the same missing intervals are requested together.
+        @see: get_values
+        @raise WebFault: if the service is unavailable for some reason.
+        '''
+        missing = dict((serie, self.__cache.missing(serie, initial_date,
+                                                     final_date))
+                       for serie in self.__series)
+
+        if self.probe:
+            # Only series already cached and missing their most recent
+            # values are worth probing
+            recent = [serie for serie in self.__series
+                      if missing[serie] and
+                          missing[serie][-1][1] == final_date and
+                          self.__cache.last_date(serie) is not None]
+
+            # Nothing can be downloaded after the last published value
+            for serie, last_date in self.__probe_last_dates(recent).items():
+                missing[serie] = [(gap_ini, min(gap_end, last_date))
+                                  for gap_ini, gap_end in missing[serie]
+                                  if gap_ini <= last_date]
+
+        gaps = dict()
+        for serie in self.__series:
+            for gap in missing[serie]:
+                calendar = self.__calendar(serie, *gap)
+                if calendar is not None and calendar.count(*gap) == 0:
+                    # Nothing can be published in the gap
+                    self.__cache.store(serie, gap[0], gap[1], dict(),
+                                       complete=True)
+                else:
+                    gaps.setdefault(gap, list()).append(serie)
+
+        for (gap_ini, gap_end), series in sorted(gaps.items()):
+            # If all series are published on business days, the gap is
+            # requested only from its first to its last business day
+            if all(self.__calendar(serie, gap_ini, gap_end) is not None
+                   for serie in series):
+                request_ini, request_end = self.CALENDAR.trim(gap_ini,
+                                                              gap_end)
+            else:
+                request_ini, request_end = gap_ini, gap_end
+
+            data = self.__soap_get_values(request_ini, request_end,
+                                          xml=self.__xml, series=series)
+
+            if self.__xml:
+                points = iter_xml_values(data)
+            else:
+                points = ((entry.oidSerie,
+                           date(entry.ano, entry.mes, entry.dia),
+                           self.__tryfloat(entry.valor))
+                          for serie in data for entry in serie.valores)
+
+            values = dict((serie, dict()) for serie in series)
+            for serie, qdate, qvalue in points:
+                values.setdefault(serie, dict())[qdate] = qvalue
+
+            for serie in series:
+                self.__cache.store(serie, gap_ini, gap_end, values[serie],
+                                   self.__calendar(serie, gap_ini, gap_end))
+
+        result = dict()
+        for serie in self.__series:
+            ticker = self.build_ID(serie)
+            for qdate, qvalue in self.__cache.get(serie, initial_date,
+                                                  final_date).items():
+                result[ticker, qdate] = qvalue
+
+        return result
+
+    def __calendar(self, serie, initial_date, final_date):
+        '''
+        @return: The BusinessCalendar of a series in an interval of dates
+                 or None if the series is not published on business days
+                 only (or the interval is out of the calendar).
+        '''
+        calendar = self.CALENDAR
+        if serie in self.__business_series and \
+                calendar.first_date <= initial_date and \
+                final_date <= calendar.last_date:
+            return calendar
+        return None
+
+    def __probe_last_dates(self, series):
+        '''
+        Find the date of the last value published for series, calling
+        "getUltimoValorVO" only for series not probed recently (according
+        to PROBE_INTERVALS).  Business series are daily, so they are never
+        probed.  Probe results are kept in the cache.
+        @param series: List of series to probe.
+        @return: A dictionary "serie: date of the last value" with the
+                 series whose last date is known.
+        @raise WebFault: if the service is unavailable for some reason.
+        '''
+        today = date.today()
+        last_dates = dict()
+        to_probe = list()
+
+        for serie in series:
+            info = self.__cache.probe_info(serie)
+            if info is None and serie in self.__business_series:
+                # Published daily, so never worth probing
+                continue
+            if info is not None:
+                probe_date, last_date, periodicity = info
+                interval = self.PROBE_INTERVALS.get(periodicity, 0)
+                if interval is None:
+                    continue
+                if (today - probe_date).days < interval:
+                    last_dates[serie] = last_date
+                    continue
+
+            to_probe.append(serie)
+
+        if not to_probe:
+            return last_dates
+
+        source = SGS(to_probe, max_workers=self.max_workers)
+        source.label = self.label
+        for serie, serie_vo in zip(to_probe,
+                                   source.__soap_get_last_value(xml=False)):
+            if serie_vo is None or not serie_vo.ultimoValor:
+                continue
+
+            value = serie_vo.ultimoValor
+            last_date = date(value.ano, value.mes, value.dia)
+            self.__cache.store_probe(serie, last_date,
+                                     serie_vo.periodicidadeSigla)
+            last_dates[serie] = last_date
+
+        return last_dates
+
     def __tryfloat(self, num):
         '''
         Try to convert a variable to float.
@@ -236,11 +681,26 @@ class SGS(Quote):
         @param data: List of WSValorSerieVO.
         @return: Dict in the form "ticker, date: quotation"
         '''
-        quote_names = [self.build_ID(entry.oidSerie)
-                   for entry in data]
-        quote_dates = [date(entry.ano, entry.mes, entry.dia)
+        with self.instrumented('build_result', rows=len(data)):
+            quote_names = [self.build_ID(entry.oidSerie)
                        for entry in data]
-        quote_values = [self.__tryfloat(entry.valor)
-                        for entry in data]
+            quote_dates = [date(entry.ano, entry.mes, entry.dia)
+                           for entry in data]
+            quote_values = [self.__tryfloat(entry.valor)
+                            for entry in data]
+
+            return dict(zip(zip(quote_names, quote_dates), quote_values))
+
+    def __build_result_xml(self, xml_data):
+        '''
+        Build the result dictionary from a "getValoresSeriesXML" response.
+        @param xml_data: The encoded XML string.
+        @return: Dict in the form "ticker, date: quotation"
+        '''
+        with self.instrumented('build_result_xml') as record:
+            result = dict(((self.build_ID(serie), qdate), qvalue)
+                          for serie, qdate, qvalue in
+                              iter_xml_values(xml_data))
+            record.rows = len(result)
 
-        return dict(zip(zip(quote_names, quote_dates), quote_values))
+        return result
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+
+from Queue import Queue, Empty
+from httplib import HTTPConnection, HTTPSConnection, HTTPException
+from socket import error as SocketError
+from threading import BoundedSemaphore, Lock
+from urlparse import urlsplit
+from xml.etree.cElementTree import fromstring
+from xml.sax.saxutils import escape
+
+from parallel import parallel_map
+from quote import Quote
+from quotesource.sgsxml import iter_xml_values, parse_last_value_xml
+
+
+class SOAPFault(Exception):
+    '''
+    Error returned by the web service (or an invalid response).
+    '''
+
+
+class ConnectionPool(object):
+    '''
+    Pool of persistent (keep-alive) HTTP connections to a single host.
+
+    Connections are created on demand and reused by the following
+    requests, so the TCP and TLS handshakes are paid only once per
+    connection instead of once per request.  The pool is thread safe: up
+    to "size" threads borrow a connection at the same time, the others
+    wait for a free one.
+    '''
+
+    def __init__(self, url, size=4, timeout=60):
+        '''
+        Constructor
+        @param url: URL of the service (only scheme, host and port are used).
+        @param size: Maximum number of connections.
+        @param timeout: Timeout of each connection, in seconds.
+        '''
+        parts = urlsplit(url)
+        if parts.scheme == 'https':
+            self.__connection_class = HTTPSConnection
+        else:
+            self.__connection_class = HTTPConnection
+        self.__netloc = parts.netloc
+
+        self.size = size
+        self.timeout = timeout
+
+        self.__idle = Queue()
+        self.__slots = BoundedSemaphore(size)
+
+    def request(self, path, body, headers):
+        '''
+        Send a POST request and read its response.
+
+        If a reused connection was closed by the server, the request is
+        sent again over a new connection.
+        @return: A tuple "status, response body".
+        @raise HTTPException: if the request fails.
+        @raise socket.error: if the connection fails.
+        '''
+        with self.__slots:
+            for attempt in (1, 2):
+                try:
+                    connection, reused = self.__idle.get_nowait(), True
+                except Empty:
+                    connection = self.__connection_class(
+                        self.__netloc, timeout=self.timeout)
+                    reused = False
+
+                try:
+                    connection.request('POST', path, body, headers)
+                    response = connection.getresponse()
+                    data = response.read()
+                except (HTTPException, SocketError):
+                    connection.close()
+                    if reused and attempt == 1:
+                        continue
+                    raise
+
+                if response.getheader('connection', '').lower() == 'close':
+                    connection.close()
+                else:
+                    self.__idle.put(connection)
+
+                return response.status, data
+
+    def close(self):
+        '''
+        Close all idle connections.
+        '''
+        while True:
+            try:
+                self.__idle.get_nowait().close()
+            except Empty:
+                return
+
+
+class SGSHTTP(Quote):
+    '''
+    Lightweight client for the SGS web service of the Central Bank of
+    Brazil (see SGS for details about the service).
+
+    Instead of a suds client built from the WSDL, the SOAP envelopes are
+    built by hand and sent over a pool of keep-alive connections shared
+    by all objects accessing the same service.  Values are requested as
+    XML and parsed directly, so no objects are built for them.  Requests
+    for several series (like get_last_value) are sent at the same time,
+    up to the size of the pool.
+
+    IDs are the same of SGS, so both classes can be used interchangeably.
+    '''
+
+    PREFIX = 'SGS'
+
+    SERVICE_URL = 'https://www3.bcb.gov.br/wssgs/services/FachadaWSSGS'
+    NAMESPACE = 'http://publico.ws.casosdeuso.sgs.pec.bcb.gov.br'
+    POOL_SIZE = 4
+
+    __pools = dict()  # service URL: ConnectionPool
+    __pools_lock = Lock()
+
+    __ENVELOPE = '<?xml version="1.0" encoding="UTF-8"?>' \
+        '<soapenv:Envelope' \
+        ' xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"' \
+        ' xmlns:soapenc="http://schemas.xmlsoap.org/soap/encoding/"' \
+        ' xmlns:xsd="http://www.w3.org/2001/XMLSchema"' \
+        ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"' \
+        ' xmlns:ns="{namespace}">' \
+        '<soapenv:Body>' \
+        '<ns:{operation} soapenv:encodingStyle=' \
+        '"http://schemas.xmlsoap.org/soap/encoding/">' \
+        '{arguments}' \
+        '</ns:{operation}>' \
+        '</soapenv:Body>' \
+        '</soapenv:Envelope>'
+
+    def __init__(self, series, url=None):
+        '''
+        Constructor of the class.
+        @param series: List of series numbers to access.
+        @param url: URL of the service.  If None, SERVICE_URL is used.
+        '''
+        super(SGSHTTP, self).__init__()
+
+        self.__XML_ENCODING = 'ISO-8859-1'
+        self.__DATE_FORMAT = '%d/%m/%Y'
+
+        self.__series = series
+        self.__url = url or self.SERVICE_URL
+        self.__path = urlsplit(self.__url).path or '/'
+        self.__pool = SGSHTTP.__get_pool(self.__url)
+
+    @staticmethod
+    def __get_pool(url):
+        '''
+        Get the connection pool shared by all objects using a service.
+        '''
+        with SGSHTTP.__pools_lock:
+            pool = SGSHTTP.__pools.get(url)
+            if pool is None:
+                pool = SGSHTTP.__pools[url] = \
+                    ConnectionPool(url, SGSHTTP.POOL_SIZE)
+
+        return pool
+
+    def __call(self, operation, *arguments):
+        '''
+        Call an operation of the web service.
+        @param arguments: The arguments: strings, integers or lists of
+                          integers.
+        @return: The value returned by the operation (a string).
+        @raise SOAPFault: if the service returns an error.
+        '''
+        str_arguments = list()
+        for index, argument in enumerate(arguments):
+            name = 'in{0}'.format(index)
+            if isinstance(argument, (list, tuple)):
+                items = ''.join('<item xsi:type="xsd:long">{0:d}</item>'
+                                .format(item) for item in argument)
+                str_arguments.append(
+                    '<{0} xsi:type="soapenc:Array" '
+                    'soapenc:arrayType="xsd:long[{1}]">{2}</{0}>'
+                    .format(name, len(argument), items))
+            elif isinstance(argument, (int, long)):
+                str_arguments.append('<{0} xsi:type="xsd:long">{1:d}</{0}>'
+                                     .format(name, argument))
+            else:
+                str_arguments.append(
+                    '<{0} xsi:type="xsd:string">{1}</{0}>'
+                    .format(name, escape(argument)))
+
+        body = self.__ENVELOPE.format(namespace=self.NAMESPACE,
+                                      operation=operation,
+                                      arguments=''.join(str_arguments))
+        headers = {'Content-Type': 'text/xml; charset=UTF-8',
+                   'SOAPAction': '""'}
+
+        with self.instrumented(operation, requests=1) as record:
+            status, data = self.__pool.request(self.__path, body, headers)
+            record.bytes = len(body) + len(data)
+
+        try:
+            envelope = fromstring(data)
+        except SyntaxError:
+            raise SOAPFault('Invalid response (HTTP {0})'.format(status))
+
+        for element in envelope.iter():
+            tag = element.tag.rsplit('}', 1)[-1]
+            if tag == 'Fault':
+                raise SOAPFault(element.findtext('faultstring'))
+            if tag == operation + 'Return':
+                return element.text or ''
+
+        raise SOAPFault('No value returned (HTTP {0})'.format(status))
+
+    def __call_xml(self, operation, *arguments):
+        '''
+        Call an operation returning XML.
+        @return: The XML string, encoded as declared in its header.
+        '''
+        return self.__call(operation, *arguments).encode(self.__XML_ENCODING)
+
+    def get_last_value(self):
+        '''
+        Get last values of series.
+        @return: A dictionary "ticker, date: quotation" with the last values
+            or None if the service is unavailable.
+        '''
+        def download(serie):
+            return parse_last_value_xml(
+                self.__call_xml('getUltimoValorXML', serie))
+
+        try:
+            last_values = parallel_map(download, self.__series,
+                                       self.__pool.size)
+        except (SOAPFault, HTTPException, SocketError):
+            return list()
+
+        return dict(((self.build_ID(serie), qdate), qvalue)
+                    for serie, qdate, qvalue, _ in filter(None, last_values))
+
+    def get_value(self, at_date):
+        '''
+        Get the quotation for the quotes for a specific date.
+        Short call to get_values(at_date, at_date).
+        @see: get_values
+        '''
+        return self.get_values(at_date, at_date)
+
+    def get_values(self, initial_date, final_date):
+        '''
+        Get all quotations available for the quotes in a interval of
+        dates.
+        @return: A dictionary "ticker, date: quotation" with all values
+            retrieved.
+        '''
+        try:
+            data = self.__call_xml('getValoresSeriesXML',
+                                   list(self.__series),
+                                   initial_date.strftime(self.__DATE_FORMAT),
+                                   final_date.strftime(self.__DATE_FORMAT))
+        except (SOAPFault, HTTPException, SocketError):
+            return list()
+
+        with self.instrumented('build_result_xml') as record:
+            result = dict(((self.build_ID(serie), qdate), qvalue)
+                          for serie, qdate, qvalue in iter_xml_values(data))
+            record.rows = len(result)
+
+        return result
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+from cStringIO import StringIO
+from datetime import date
+from xml.etree.cElementTree import fromstring, iterparse
+
+
+def iter_xml_values(xml_data):
+    '''
+    Parse the XML returned by "getValoresSeriesXML" incrementally, without
+    building an object for each value.
+
+    The XML has the form:
+        <SERIES>
+          <SERIE ID="433">
+            <ITEM>
+              <DATA>01/2013</DATA>
+              <VALOR>0,86</VALOR>
+            </ITEM>
+            ...
+          </SERIE>
+          ...
+        </SERIES>
+
+    Dates may be in the formats "dd/mm/yyyy", "mm/yyyy" or "yyyy" (the
+    first day of the period is used), and values use comma as decimal
+    separator.
+    @param xml_data: The XML string, encoded as declared in its header.
+    @return: A generator of tuples "serie, date, quotation".  Values that
+             can not be converted are returned as None.
+    '''
+    root = None
+    parent = None  # element of the current series
+    serie = None
+    qdate = None
+    qvalue = None
+
+    for event, element in iterparse(StringIO(xml_data),
+                                    events=('start', 'end')):
+        tag = element.tag
+        if event == 'start':
+            if root is None:
+                root = element
+            if tag == 'SERIE':
+                parent = element
+                serie = int(element.get('ID'))
+            elif tag == 'ITEM':
+                qdate = qvalue = None
+            continue
+
+        if tag == 'DATA':
+            qdate = parse_xml_date(element.text)
+        elif tag == 'VALOR':
+            qvalue = parse_xml_value(element.text)
+        elif tag == 'ITEM':
+            yield serie, qdate, qvalue
+            # Release the parsed items, detaching them from their series,
+            # so memory stays flat
+            if parent is not None:
+                parent.clear()
+        elif tag == 'SERIE' and element is not root:
+            # Release the parsed series, detaching them from the root
+            root.clear()
+
+
+def parse_xml_date(text):
+    '''
+    @param text: A date as "dd/mm/yyyy", "mm/yyyy" or "yyyy".
+    @return: The date.
+    '''
+    parts = [int(part) for part in text.strip().split('/')]
+    while len(parts) < 3:
+        parts.insert(0, 1)
+
+    day, month, year = parts
+    return date(year, month, day)
+
+
+def parse_xml_value(text):
+    '''
+    @param text: A value with comma as decimal separator (e.g. "1.234,56").
+    @return: The value as float or None if it is not a number.
+    '''
+    if not text:
+        return None
+
+    text = text.strip()
+    if ',' in text:
+        text = text.replace('.', '').replace(',', '.')
+
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def parse_last_value_xml(xml_data):
+    '''
+    Parse the XML returned by "getUltimoValorXML".
+
+    The XML has the form:
+        <resposta status="2">
+          <SERIE>
+            <NOME>...</NOME>
+            <CODIGO>433</CODIGO>
+            <PERIODICIDADE>M</PERIODICIDADE>
+            <UNIDADE>%</UNIDADE>
+            <DATA><DIA>1</DIA><MES>9</MES><ANO>2013</ANO></DATA>
+            <VALOR>0,35</VALOR>
+          </SERIE>
+        </resposta>
+    @param xml_data: The XML string, encoded as declared in its header.
+    @return: A tuple "serie, date, quotation, periodicity" or None if the
+             XML holds no value.
+    '''
+    root = fromstring(xml_data)
+    serie = root if root.tag == 'SERIE' else root.find('SERIE')
+    if serie is None or serie.find('DATA') is None:
+        return None
+
+    qdate = serie.find('DATA')
+    qdate = date(int(qdate.findtext('ANO')),
+                 int(qdate.findtext('MES') or 1),
+                 int(qdate.findtext('DIA') or 1))
+
+    return (int(serie.findtext('CODIGO')), qdate,
+            parse_xml_value(serie.findtext('VALOR')),
+            serie.findtext('PERIODICIDADE'))
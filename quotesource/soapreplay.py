@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+from cPickle import dumps, loads, HIGHEST_PROTOCOL
+from cStringIO import StringIO
+from datetime import date, timedelta
+from hashlib import sha1
+from httplib import INTERNAL_SERVER_ERROR, OK, SERVICE_UNAVAILABLE
+from os import makedirs, rename
+from os.path import exists, join
+from suds.transport import Reply, TransportError
+from suds.properties import Unskin
+from thread import get_ident
+from time import time
+from xml.sax.saxutils import escape
+import re
+import zlib
+
+from quotesource.soaptransport import MeasuredTransport
+
+
+class ResponseStore(object):
+    '''
+    Compressed on-disk store of raw responses.
+
+    Each response is kept in its own file, named by its key (split in
+    subdirectories by the first two characters), holding the compressed
+    response with the time it expires.
+    '''
+
+    def __init__(self, directory, level=6):
+        '''
+        Constructor
+        @param directory: Directory of the store (created if needed).
+        @param level: Compression level (see zlib).
+        '''
+        self.directory = directory
+        self.level = level
+
+    def get(self, key):
+        '''
+        @return: A tuple "response, expiration time" (None if it never
+                 expires) or None if the key is not stored.
+        '''
+        filename = self.__filename(key)
+        if not exists(filename):
+            return None
+
+        with open(filename, 'rb') as f:
+            return loads(zlib.decompress(f.read()))
+
+    def put(self, key, response, expires=None):
+        '''
+        Store a response, replacing the previous one.
+        @param response: The response (a string).
+        @param expires: Time (as returned by time.time) the response
+                        expires, or None if it never expires.
+        '''
+        filename = self.__filename(key)
+        directory = join(self.directory, key[:2])
+        if not exists(directory):
+            try:
+                makedirs(directory)
+            except OSError:
+                pass  # created by another thread
+
+        tmp_filename = '{0}.{1}.tmp'.format(filename, get_ident())
+        with open(tmp_filename, 'wb') as f:
+            f.write(zlib.compress(dumps((response, expires),
+                                        HIGHEST_PROTOCOL), self.level))
+        rename(tmp_filename, filename)
+
+    def __filename(self, key):
+        return join(self.directory, key[:2], key)
+
+
+class ReplayTransport(MeasuredTransport):
+    '''
+    suds transport recording the responses of the web service, to serve
+    identical requests again without accessing the network.
+
+    Requests are identified by URL, SOAP action and message, so the same
+    operation with the same arguments gets the same response.  Documents
+    (like the WSDL) are recorded too.  A response is replayed while it is
+    fresh: responses to requests whose dates (as "dd/mm/yyyy") all lie more
+    than "settle_days" days in the past refer to closed historical ranges
+    and never expire; other responses expire after "ttl" seconds.  Faults
+    are never recorded.
+
+    In offline mode every recorded response is replayed, fresh or not, and
+    requests never recorded fail instead of accessing the network: calls
+    get a SOAP fault (raised by suds as WebFault, like any failure of the
+    service) and documents a TransportError.
+
+    Only requests sent to the network are measured (see MeasuredTransport).
+
+    Since keys include the whole message, a request is only replayed if
+    its arguments are exactly the same.  Requests with dates computed from
+    the current day (like "the last 60 days") therefore only match the
+    records of the same day.
+
+    Usage:
+        transport = ReplayTransport(ResponseStore('replay'))
+        soap = client.Client(url, transport=transport)
+    '''
+
+    __DATE = re.compile(r'\b(\d{2})/(\d{2})/(\d{4})\b')
+
+    __FAULT = '''<?xml version="1.0" encoding="UTF-8"?>
+<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">
+ <soapenv:Body>
+  <soapenv:Fault>
+   <faultcode>soapenv:Server</faultcode>
+   <faultstring>{0}</faultstring>
+  </soapenv:Fault>
+ </soapenv:Body>
+</soapenv:Envelope>'''
+
+    def __init__(self, store, offline=False, ttl=60 * 60, settle_days=45,
+                 **kwargs):
+        '''
+        Constructor
+        @param store: A ResponseStore.
+        @param offline: If True, only recorded responses are used.
+        @param ttl: Seconds a response to a recent request is replayed.
+        @param settle_days: Number of days values may take to be published.
+        @param kwargs: Options of the HTTP transport (like "proxy").
+        '''
+        MeasuredTransport.__init__(self, **kwargs)
+        self.store = store
+        self.offline = offline
+        self.ttl = ttl
+        self.settle_days = settle_days
+
+    def open(self, request):
+        key = sha1('GET\0' + request.url).hexdigest()
+
+        response = self.__replay(key, request.url)
+        if response is None:
+            response = MeasuredTransport.open(self, request).read()
+            self.store.put(key, response, time() + self.ttl)
+
+        return StringIO(response)
+
+    def send(self, request):
+        action = request.headers.get('SOAPAction', '')
+        key = sha1('\0'.join((request.url, action,
+                              request.message))).hexdigest()
+
+        try:
+            response = self.__replay(key, request.url)
+        except TransportError as error:
+            # Reported as a fault of the service
+            fault = self.__FAULT.format(escape(str(error)))
+            raise TransportError(str(error), INTERNAL_SERVER_ERROR,
+                                 StringIO(fault))
+        if response is not None:
+            return Reply(OK, {}, response)
+
+        reply = MeasuredTransport.send(self, request)
+        if reply is not None:
+            self.store.put(key, reply.message,
+                           self.__expires(request.message))
+        return reply
+
+    def __replay(self, key, url):
+        '''
+        @return: The recorded response or None if it must be requested.
+        @raise TransportError: if offline and there is no response.
+        '''
+        entry = self.store.get(key)
+        if entry is not None:
+            response, expires = entry
+            if self.offline or expires is None or expires > time():
+                return response
+
+        if self.offline:
+            raise TransportError('No recorded response for ' + url,
+                                 SERVICE_UNAVAILABLE)
+        return None
+
+    def __expires(self, message):
+        '''
+        @return: When the response to a message expires or None if never.
+        '''
+        dates = [date(int(year), int(month), int(day))
+                 for day, month, year in self.__DATE.findall(message)]
+
+        settle_date = date.today() - timedelta(days=self.settle_days)
+        if dates and max(dates) < settle_date:
+            return None
+        return time() + self.ttl
+
+    def __deepcopy__(self, memo={}):
+        # suds clients copy their transport when cloned
+        clone = self.__class__(self.store, self.offline, self.ttl,
+                               self.settle_days)
+        Unskin(clone.options).update(Unskin(self.options))
+        return clone
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+from suds.transport.https import HttpAuthenticated
+
+
+class MeasuredTransport(HttpAuthenticated):
+    '''
+    suds transport measuring the round trip of each request to the web
+    service (from sending the request to receiving the whole reply) and
+    the size of the replies, apart from the serialization and
+    deserialization done by suds.
+
+    Measures go to the stage "soap_send" of "source" (see
+    Quote.instrumented), set by the user of the client while it sends
+    requests.  Nothing is measured while "source" is None.
+
+    Usage:
+        soap = client.Client(url, transport=MeasuredTransport())
+        soap.options.transport.source = sgs
+    '''
+
+    def __init__(self, **kwargs):
+        '''
+        Constructor
+        @param kwargs: Options of the HTTP transport (like "proxy").
+        '''
+        HttpAuthenticated.__init__(self, **kwargs)
+        self.source = None
+
+    def send(self, request):
+        if self.source is None:
+            return HttpAuthenticated.send(self, request)
+
+        with self.source.instrumented('soap_send', requests=1) as record:
+            reply = HttpAuthenticated.send(self, request)
+            if reply is not None:
+                record.bytes = len(reply.message)
+
+        return reply
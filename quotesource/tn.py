@@ -1,38 +1,335 @@
 # -*- coding: utf-8 -*-
 
+from cPickle import dump, load, HIGHEST_PROTOCOL
+from datetime import date, datetime, timedelta
+from hashlib import sha1
+from multiprocessing import Pool
+from os import makedirs, rename
+from os.path import exists, join
+from tempfile import gettempdir
+from threading import Lock
+from urllib2 import urlopen
+import json
+
+from parallel import parallel_map
 from quote import Quote
 
 
 class TN(Quote):
     '''
     Tesouro Nacional
+
+    Historical prices of the bonds sold by Tesouro Direto are published in
+    one file per bond type and year (e.g. "LTN_2013.xls"), with one sheet
+    per maturity (e.g. "LTN 010117").  The quotation is the base unit price
+    (PU Base) of each day.
+
+    Yearly files are kept in a local content-addressed cache at CACHE_DIR
+    (the system temporary directory if None): each file is saved under its
+    SHA-1 hash, and an index maps each bond type and year to its hash.  A
+    file is downloaded again only if it is missing or, while its year may
+    still get new prices, older than CACHE_DAYS days.  Files fetched more
+    than SETTLE_DAYS days after the end of their year are final (late
+    prices are published by then).  Files are parsed in
+    up to PROCESSES worker processes, and parsed results are saved beside
+    the files by hash, so past years are parsed only once.
+
+    Files are downloaded from FILE_URL, formatted with the bond type and
+    the year.  Any URL supported by urllib2 works (like "file://" URLs to
+    local files).  Besides the published Excel files (which need xlrd),
+    files may also be semicolon separated text with a header line holding
+    at least "Data Vencimento", "Data Base" and "PU Base Manha".
     '''
 
+    FILE_URL = 'http://www.tesouro.fazenda.gov.br/documents/10180/' \
+               '137713/{bond}_{year}.xls'
+    CACHE_DIR = None
+    CACHE_DAYS = 1
+    SETTLE_DAYS = 45
+    PROCESSES = 4
+
+    __parsed = dict()  # file hash: parsed file (see parse_file)
+    __cache_lock = Lock()
+
     def __init__(self, tn_id):
         '''
         Constructor
+        @param tn_id: Bond type and maturity (as "ddmmyy"), as named by the
+                      sheets of the yearly files (e.g. 'LTN 010117' or
+                      'NTN-B 150824').
         '''
         super(TN, self).__init__()
         self.__quote_id = tn_id
+        self.__bond, self.__maturity = tn_id.rsplit(' ', 1)
+        self.__ticker = self.build_ID(tn_id.replace(' ', '_'))
 
     def get_last_value(self):
-        # FIXME: must implement
-        raise NotImplementedError()
+        '''
+        Get last available value for the bond.
+        @return: A dictionary "ticker, date: quotation" with the last value
+                 (empty if there is none).
+        '''
+        today = date.today()
+        values = self.get_values(date(today.year - 1, 1, 1), today)
+        if not values:
+            return dict()
+
+        last = max(values)
+        return {last: values[last]}
 
-    def get_value(self, atDate):
-        # FIXME: must implement
-        raise NotImplementedError()
+    def get_value(self, at_date):
+        '''
+        Get the quotation of the bond for a specific date.
+        Short call to get_values(at_date, at_date).
+        @see: get_values
+        '''
+        return self.get_values(at_date, at_date)
 
     def get_values(self, initial_date, final_date):
-        # FIXME: must implement
+        '''
+        Get all quotations available for the bond in a interval of dates.
+        Years whose file can not be downloaded are ignored.
+        @return: A dictionary "ticker, date: quotation" with all values
+            retrieved.
+        '''
+        years = self.__year_range(initial_date, final_date)
+
+        with self.instrumented('fetch_files'):
+            hashes = parallel_map(self.__load_file, years, len(years))
 
-        #for year in self.__yearRange(initial_date, final_date):
-            # Download needed files
-            #pass
+        with self.instrumented('parse_files') as record:
+            parsed = self.__parse_files([file_hash for file_hash in hashes
+                                         if file_hash is not None])
 
-        # detect years based on dates
+            result = dict()
+            for prices in parsed:
+                for qdate, price in prices.get(self.__maturity, ()):
+                    if initial_date <= qdate <= final_date:
+                        result[(self.__ticker, qdate)] = price
 
-        raise NotImplementedError()
+            record.rows = len(result)
+
+        return result
 
     def __year_range(self, initialDate, finalDate):
         return range(initialDate.year, finalDate.year + 1)
+
+    def __cache_dir(self):
+        cache_dir = self.CACHE_DIR or join(gettempdir(), 'tn')
+        if not exists(cache_dir):
+            makedirs(cache_dir)
+        return cache_dir
+
+    def __load_file(self, year):
+        '''
+        Get a yearly file of the bond type into the cache, downloading it
+        if it is missing or stale.
+        @return: The hash of the file or None if it is not available.
+        '''
+        cache_dir = self.__cache_dir()
+        key = '{0}_{1}'.format(self.__bond, year)
+
+        with TN.__cache_lock:
+            entry = self.__load_index(cache_dir).get(key)
+
+        if entry is not None:
+            file_hash, fetched = entry
+            settled = date(year, 12, 31) + timedelta(days=self.SETTLE_DAYS)
+            if fetched.date() > settled or \
+                    datetime.now() - fetched < timedelta(days=self.CACHE_DAYS):
+                return file_hash
+
+        try:
+            response = urlopen(self.FILE_URL.format(bond=self.__bond,
+                                                    year=year))
+            try:
+                data = response.read()
+            finally:
+                response.close()
+        except IOError:
+            # Keep using the stale file, if any
+            return entry[0] if entry is not None else None
+
+        file_hash = sha1(data).hexdigest()
+        filename = join(cache_dir, file_hash)
+        if not exists(filename):
+            with open(filename + '.tmp', 'wb') as f:
+                f.write(data)
+            rename(filename + '.tmp', filename)
+
+        with TN.__cache_lock:
+            index = self.__load_index(cache_dir)
+            index[key] = (file_hash, datetime.now())
+            self.__save_index(cache_dir, index)
+
+        return file_hash
+
+    def __parse_files(self, hashes):
+        '''
+        Parse cached files, using the parsed results already saved and
+        parsing the others at the same time in worker processes.
+        @param hashes: List of file hashes.
+        @return: A list with the parsed files (see parse_file).
+        '''
+        cache_dir = self.__cache_dir()
+
+        parsed = dict()
+        for file_hash in set(hashes):
+            prices = TN.__parsed.get(file_hash)
+            if prices is None and exists(join(cache_dir, file_hash + '.pkl')):
+                with open(join(cache_dir, file_hash + '.pkl'), 'rb') as f:
+                    prices = load(f)
+            if prices is not None:
+                parsed[file_hash] = TN.__parsed[file_hash] = prices
+
+        missing = [file_hash for file_hash in set(hashes)
+                   if file_hash not in parsed]
+        filenames = [join(cache_dir, file_hash) for file_hash in missing]
+
+        if len(missing) > 1 and self.PROCESSES > 1:
+            pool = Pool(min(self.PROCESSES, len(missing)))
+            try:
+                results = pool.map(parse_file, filenames)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [parse_file(filename) for filename in filenames]
+
+        for file_hash, filename, prices in zip(missing, filenames, results):
+            with open(filename + '.pkl.tmp', 'wb') as f:
+                dump(prices, f, HIGHEST_PROTOCOL)
+            rename(filename + '.pkl.tmp', filename + '.pkl')
+            parsed[file_hash] = TN.__parsed[file_hash] = prices
+
+        return [parsed[file_hash] for file_hash in hashes]
+
+    def __load_index(self, cache_dir):
+        '''
+        @return: A dictionary "bond_year: (file hash, fetch datetime)".
+        '''
+        index_file = join(cache_dir, 'index.json')
+        if not exists(index_file):
+            return dict()
+
+        with open(index_file, 'rb') as f:
+            index = json.load(f)
+
+        return dict((key, (file_hash, datetime.strptime(fetched,
+                                                        '%Y-%m-%dT%H:%M:%S')))
+                    for key, (file_hash, fetched) in index.items())
+
+    def __save_index(self, cache_dir, index):
+        index_file = join(cache_dir, 'index.json')
+        with open(index_file + '.tmp', 'wb') as f:
+            json.dump(dict((key, (file_hash,
+                                  fetched.strftime('%Y-%m-%dT%H:%M:%S')))
+                           for key, (file_hash, fetched) in index.items()),
+                      f, indent=0, sort_keys=True)
+        rename(index_file + '.tmp', index_file)
+
+
+# Worker functions must be defined at module level, so worker processes
+# can find them.
+
+def parse_file(filename):
+    '''
+    Parse a yearly file of Tesouro Nacional.
+    @param filename: Name of an Excel file or a semicolon separated file.
+    @return: A dictionary "maturity (as 'ddmmyy'): list of tuples 'date,
+             price'".
+    '''
+    with open(filename, 'rb') as f:
+        data = f.read()
+
+    if data.startswith('\xd0\xcf\x11\xe0'):
+        return parse_xls(data)
+    return parse_text(data)
+
+
+def parse_xls(data):
+    '''
+    Parse an Excel yearly file: one sheet per maturity, named as
+    "BOND ddmmyy", with the date in the first column and the base unit
+    price in the sixth one.
+    @raise ImportError: if xlrd is not installed.
+    @see: parse_file
+    '''
+    import xlrd
+
+    book = xlrd.open_workbook(file_contents=data)
+    result = dict()
+    for sheet in book.sheets():
+        maturity = sheet.name.strip().rsplit(' ', 1)[-1]
+        prices = result.setdefault(maturity, list())
+
+        for row in range(sheet.nrows):
+            cells = sheet.row_values(row)
+            if len(cells) < 6:
+                continue
+
+            qdate = parse_xls_date(cells[0], book.datemode)
+            price = parse_number(cells[5])
+            if qdate is not None and price is not None:
+                prices.append((qdate, price))
+
+    return result
+
+
+def parse_text(data):
+    '''
+    Parse a semicolon separated yearly file, with a header line.
+    @see: parse_file
+    '''
+    lines = data.splitlines()
+    if not lines:
+        return dict()
+
+    header = [name.strip() for name in lines[0].split(';')]
+    maturity_column = header.index('Data Vencimento')
+    date_column = header.index('Data Base')
+    price_column = header.index('PU Base Manha')
+
+    result = dict()
+    for line in lines[1:]:
+        cells = line.split(';')
+        if len(cells) < len(header):
+            continue
+
+        maturity = datetime.strptime(cells[maturity_column].strip(),
+                                     '%d/%m/%Y').strftime('%d%m%y')
+        qdate = datetime.strptime(cells[date_column].strip(),
+                                  '%d/%m/%Y').date()
+        price = parse_number(cells[price_column])
+        if price is not None:
+            result.setdefault(maturity, list()).append((qdate, price))
+
+    return result
+
+
+def parse_xls_date(cell, datemode):
+    '''
+    @return: The date of an Excel cell or None if it is not a date.
+    '''
+    if isinstance(cell, float):
+        import xlrd
+        return date(*xlrd.xldate_as_tuple(cell, datemode)[:3])
+
+    try:
+        return datetime.strptime(cell.strip(), '%d/%m/%Y').date()
+    except ValueError:
+        return None  # header lines
+
+
+def parse_number(cell):
+    '''
+    @return: The number of an Excel cell or text (in Brazilian format, like
+             '1.234,56'), or None if it is not a number.
+    '''
+    if isinstance(cell, float):
+        return cell
+
+    try:
+        return float(cell.strip().replace('.', '').replace(',', '.'))
+    except ValueError:
+        return None
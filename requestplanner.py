@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+from parallel import parallel_map
+
+
+class RequestPlanner(object):
+    '''
+    Plan the downloads of several jobs over the same data source.
+
+    Jobs frequently share series (e.g. a monthly index and its accumulated
+    version).  Instead of one request per job, each series is downloaded
+    only once, covering the union of the windows of all jobs that use it,
+    and series needing the same window are requested together.  After
+    fetching, each job gets a source that serves its values from the
+    downloaded data.
+
+    Usage:
+        planner = RequestPlanner(SGS)
+        planner.add_job('IPCA', [433], initial_date, final_date)
+        planner.fetch()
+        qcsv = QuickenCSV(planner.source('IPCA'))
+    '''
+
+    def __init__(self, source_factory):
+        '''
+        Constructor
+        @param source_factory: Callable receiving a list of series and
+                               returning a quote source for them.
+        '''
+        self.source_factory = source_factory
+
+        self.__jobs = dict()  # name: (series, initial date, final date)
+        self.__values = dict()
+
+    def add_job(self, name, series, initial_date, final_date):
+        '''
+        Add a job to the plan.
+        @param name: Unique name of the job.
+        @param series: List of series used by the job.
+        '''
+        self.__jobs[name] = (list(series), initial_date, final_date)
+
+    def plan(self):
+        '''
+        Build the minimal list of requests needed by all jobs.
+        @return: A list of tuples "series, initial date, final date",
+                 one for each distinct window.
+        '''
+        windows = dict()  # serie: [initial date, final date]
+        for series, initial_date, final_date in self.__jobs.values():
+            for serie in series:
+                window = windows.setdefault(serie, [initial_date, final_date])
+                window[0] = min(window[0], initial_date)
+                window[1] = max(window[1], final_date)
+
+        requests = dict()  # (initial date, final date): series
+        for serie, (initial_date, final_date) in windows.items():
+            requests.setdefault((initial_date, final_date), []).append(serie)
+
+        return [(sorted(series), initial_date, final_date)
+                for (initial_date, final_date), series in
+                    sorted(requests.items())]
+
+    def fetch(self, max_workers=4):
+        '''
+        Download the values of all planned requests at the same time.
+
+        Each request gets its own source, built by the source factory, so
+        sources only need to be safe for use alongside other sources (SGS
+        objects are: each request takes its own SOAP client).  Sources not
+        safe for that must be fetched with "max_workers" 1.
+
+        The stages of each source are labeled by the IDs of its series
+        (see Quote.instrumented), so requests are measured apart.
+        @param max_workers: Maximum number of requests at the same time.
+        @return: Number of requests done.
+        '''
+        def download(request):
+            series, initial_date, final_date = request
+            # Never shared between threads
+            source = self.source_factory(series)
+            source.label = source.build_ID(
+                ','.join(str(serie) for serie in series))
+            return source.get_values(initial_date, final_date)
+
+        requests = self.plan()
+        for values in parallel_map(download, requests, max_workers):
+            self.__values.update(values)
+
+        return len(requests)
+
+    def source(self, name):
+        '''
+        Get a quote source serving the downloaded values of a job.
+        @param name: Name of the job.
+        @return: A PlannedSource.
+        '''
+        series = self.__jobs[name][0]
+        return PlannedSource(self.source_factory(series), series,
+                             self.__values)
+
+
+class PlannedSource(object):
+    '''
+    Quote source serving values already downloaded by a RequestPlanner.
+
+    Any attribute other than get_values is taken from the original source.
+    '''
+
+    def __init__(self, source, series, values):
+        '''
+        Constructor
+        @param source: The original quote source of the series.
+        @param series: List of series of the source.
+        @param values: Dictionary "ticker, date: quotation" with the
+                       downloaded values (may hold other series).
+        '''
+        self.__source = source
+        self.__tickers = set(source.build_ID(serie) for serie in series)
+        self.__values = values
+
+    def get_values(self, initial_date, final_date):
+        '''
+        Get all downloaded quotations of the series in a interval of dates.
+        @see: Quote.get_values
+        '''
+        return dict(((ticker, qdate), qvalue)
+                    for (ticker, qdate), qvalue in self.__values.items()
+                    if ticker in self.__tickers and
+                        initial_date <= qdate <= final_date)
+
+    def __getattr__(self, name):
+        return getattr(self.__source, name)
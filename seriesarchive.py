@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+
+from datetime import date
+from mmap import mmap, ACCESS_READ
+from os import listdir, makedirs
+from os.path import exists, getsize, join, splitext
+from struct import Struct
+
+from seriesdata import NAN, SeriesData
+
+
+class SeriesArchive(object):
+    '''
+    Compact on-disk archive of full series histories.
+
+    Each symbol is kept in its own file ("<symbol>.bin" inside the archive
+    directory), made of a small header followed by fixed-width records
+    (date ordinal as int32 and value as float64, little endian) sorted by
+    date.  Missing values are stored as NaN.
+
+    Reading maps the file in memory and finds the interval requested by
+    binary search, so only the pages holding the interval are touched.
+    New points are appended at the end of the files; the number of
+    records comes from the file size, so the header never changes.  A
+    partial record left by an interrupted write is ignored, and dropped
+    by the next append.
+
+    Usage:
+        archive = SeriesArchive('archive')
+        archive.update(sgs.get_values(initial_date, final_date))
+        qcsv = QuickenCSV(archive.source(['SGS_433']), 12, 'interest')
+        qcsv.update_values(initial_date, final_date)
+    '''
+
+    MAGIC = 'BR4Q'
+    VERSION = 1
+
+    __HEADER = Struct('<4sHH')  # magic, version, record size
+    __RECORD = Struct('<id')  # date ordinal, value
+    __ORDINAL = Struct('<i')
+
+    def __init__(self, directory):
+        '''
+        Constructor
+        @param directory: Directory of the archive (created if needed).
+        '''
+        self.directory = directory
+
+        if not exists(directory):
+            makedirs(directory)
+
+    def symbols(self):
+        '''
+        @return: A sorted list with all symbols in the archive.
+        '''
+        return sorted(splitext(name)[0] for name in listdir(self.directory)
+                      if name.endswith('.bin'))
+
+    def append(self, symbol, points):
+        '''
+        Append points to a symbol.  Points not newer than the last point
+        already archived are ignored.
+        @param points: Iterable of tuples "date, quotation" sorted by date.
+        @return: Number of points appended.
+        '''
+        filename = self.__filename(symbol)
+        last_date = self.last_date(symbol)
+
+        records = [self.__RECORD.pack(qdate.toordinal(),
+                                      NAN if qvalue is None else qvalue)
+                   for qdate, qvalue in points
+                   if last_date is None or qdate > last_date]
+        if not records:
+            return 0
+
+        with open(filename, 'r+b' if exists(filename) else 'wb') as f:
+            # An interrupted write may leave part of a record (or of the
+            # header) at the end of the file: it is dropped, so the new
+            # records stay aligned
+            count = self.count(symbol)
+            if count < 0:
+                f.truncate(0)
+                f.write(self.__HEADER.pack(self.MAGIC, self.VERSION,
+                                           self.__RECORD.size))
+            else:
+                f.seek(self.__offset(count))
+                f.truncate()
+            f.write(''.join(records))
+
+        return len(records)
+
+    def update(self, values):
+        '''
+        Append the new points of several symbols.
+        @param values: A dictionary "ticker, date: quotation" or SeriesData.
+        @return: Number of points appended.
+        '''
+        if not isinstance(values, SeriesData):
+            values = SeriesData(values)
+
+        return sum(self.append(symbol, values.points(symbol))
+                   for symbol in values.symbols())
+
+    def count(self, symbol):
+        '''
+        @return: Number of points of a symbol.
+        '''
+        filename = self.__filename(symbol)
+        if not exists(filename):
+            return 0
+        return (getsize(filename) - self.__HEADER.size) // self.__RECORD.size
+
+    def last_date(self, symbol):
+        '''
+        @return: The date of the last point of a symbol or None.
+        '''
+        count = self.count(symbol)
+        if count <= 0:
+            return None
+
+        with open(self.__filename(symbol), 'rb') as f:
+            f.seek(self.__offset(count - 1))
+            return date.fromordinal(
+                self.__ORDINAL.unpack(f.read(self.__ORDINAL.size))[0])
+
+    def points(self, symbol, initial_date=None, final_date=None):
+        '''
+        Read the points of a symbol in an interval of dates.
+        @return: A generator of tuples "date, quotation" sorted by date.
+        '''
+        count = self.count(symbol)
+        if count <= 0:
+            return
+
+        with open(self.__filename(symbol), 'rb') as f:
+            data = mmap(f.fileno(), 0, access=ACCESS_READ)
+
+        try:
+            self.__check_header(symbol, data)
+
+            begin = 0 if initial_date is None else \
+                self.__search(data, count, initial_date.toordinal())
+            end = count if final_date is None else \
+                self.__search(data, count, final_date.toordinal() + 1)
+
+            unpack_from = self.__RECORD.unpack_from
+            fromordinal = date.fromordinal
+            for index in xrange(begin, end):
+                ordinal, qvalue = unpack_from(data, self.__offset(index))
+                # NaN is the only value not equal to itself
+                yield fromordinal(ordinal), \
+                    None if qvalue != qvalue else qvalue
+        finally:
+            data.close()
+
+    def load(self, symbols=None, initial_date=None, final_date=None):
+        '''
+        Read the points of several symbols in an interval of dates.
+        @param symbols: List of symbols.  If None, all symbols.
+        @return: A SeriesData.
+        '''
+        if symbols is None:
+            symbols = self.symbols()
+
+        values = SeriesData()
+        for symbol in symbols:
+            values.update(dict(((symbol, qdate), qvalue)
+                               for qdate, qvalue in
+                                   self.points(symbol, initial_date,
+                                               final_date)))
+
+        return values
+
+    def source(self, symbols):
+        '''
+        Get a quote source reading symbols from the archive, to be used
+        with QuickenCSV.
+        @param symbols: List of symbols.
+        @return: An ArchiveSource.
+        '''
+        return ArchiveSource(self, symbols)
+
+    def __filename(self, symbol):
+        return join(self.directory, symbol + '.bin')
+
+    def __offset(self, index):
+        return self.__HEADER.size + index * self.__RECORD.size
+
+    def __search(self, data, count, ordinal):
+        '''
+        @return: The index of the first record with date ordinal equal or
+                 greater than "ordinal".
+        '''
+        unpack_from = self.__ORDINAL.unpack_from
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if unpack_from(data, self.__offset(middle))[0] < ordinal:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def __check_header(self, symbol, data):
+        '''
+        @raise ValueError: if the file is not a valid archive file.
+        '''
+        magic, version, record_size = self.__HEADER.unpack_from(data, 0)
+        if magic != self.MAGIC or version != self.VERSION or \
+                record_size != self.__RECORD.size:
+            msg = "Invalid archive file for symbol '{0}'."
+            raise ValueError(msg.format(symbol))
+
+
+class ArchiveSource(object):
+    '''
+    Quote source reading values from a SeriesArchive.
+    '''
+
+    def __init__(self, archive, symbols):
+        self.archive = archive
+        self.symbols = list(symbols)
+
+    def get_values(self, initial_date, final_date):
+        '''
+        Get all archived quotations of the symbols in a interval of dates.
+        @return: A SeriesData.
+        @see: Quote.get_values
+        '''
+        return self.archive.load(self.symbols, initial_date, final_date)
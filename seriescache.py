@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+import cPickle as pickle
+from datetime import date, timedelta
+from os import rename
+from os.path import exists
+from threading import RLock
+
+from seriesdata import SeriesData
+
+
+class SeriesCache(object):
+    '''
+    Persistent local cache of time series values.
+
+    For each series the cache keeps the values already downloaded and the
+    list of date spans known to be complete, so only the missing gaps of
+    a requested interval need to be downloaded again.
+
+    Recent spans are only partially trusted: since a data source may
+    publish a value some time after its reference date (monthly series
+    are usually published weeks later), a span ending less than
+    "settle_days" ago is only considered complete up to its last value.
+
+    The cache is thread safe, so it can be shared by several SGS objects
+    downloading at the same time.
+    '''
+
+    def __init__(self, filename=None, settle_days=45):
+        '''
+        Constructor
+        @param filename: File used to persist the cache.  If None, the cache
+                         is kept only in memory.
+        @param settle_days: Number of days a value may take to be published.
+        '''
+        self.filename = filename
+        self.settle_days = settle_days
+
+        self.__spans = {}  # serie: sorted list of [initial, final] ordinals
+        self.__values = SeriesData()  # values by "serie, date"
+        self.__probes = {}  # serie: (probe date, last date, periodicity)
+        self.__lock = RLock()
+
+        if filename and exists(filename):
+            self.load()
+
+    def load(self):
+        '''
+        Load the cache from its file, replacing the data in memory.
+        '''
+        with self.__lock, open(self.filename, 'rb') as f:
+            data = pickle.load(f)
+
+            # Files saved by older versions have no probes, and may keep
+            # values as a dictionary "serie: {date: value}"
+            spans, values = data[:2]
+            probes = data[2] if len(data) > 2 else {}
+            if not isinstance(values, SeriesData):
+                values = SeriesData(dict(
+                    ((serie, qdate), qvalue)
+                    for serie, points in values.items()
+                    for qdate, qvalue in points.items()))
+
+            self.__spans, self.__values, self.__probes = spans, values, probes
+
+    def save(self):
+        '''
+        Save the cache to its file.  The file is replaced atomically, so
+        an interrupted run never leaves a corrupted cache behind.
+        '''
+        if not self.filename:
+            return
+
+        tmp_filename = self.filename + '.tmp'
+        with self.__lock, open(tmp_filename, 'wb') as f:
+            pickle.dump((self.__spans, self.__values, self.__probes), f,
+                        pickle.HIGHEST_PROTOCOL)
+        rename(tmp_filename, self.filename)
+
+    def missing(self, serie, initial_date, final_date):
+        '''
+        Find the intervals of dates not held by the cache.
+        @param serie: The series number.
+        @return: A list of tuples "initial date, final date", in ascending
+                 order, with the gaps that must be downloaded.
+        '''
+        gaps = list()
+        ini = initial_date.toordinal()
+        end = final_date.toordinal()
+
+        with self.__lock:
+            spans = list(self.__spans.get(serie, ()))
+
+        for span_ini, span_end in spans:
+            if span_end < ini:
+                continue
+            if span_ini > end:
+                break
+            if span_ini > ini:
+                gaps.append((ini, span_ini - 1))
+            ini = span_end + 1
+
+        if ini <= end:
+            gaps.append((ini, end))
+
+        return [(date.fromordinal(gap_ini), date.fromordinal(gap_end))
+                for gap_ini, gap_end in gaps]
+
+    def store(self, serie, initial_date, final_date, values, calendar=None,
+              complete=False):
+        '''
+        Store the values downloaded for an interval of dates.
+        @param serie: The series number.
+        @param values: A dictionary "date: quotation" with all values
+                       available in the interval.
+        @param calendar: A BusinessCalendar, for series published on every
+                         business day.  A recent interval is then only
+                         complete up to its first business day without a
+                         value (in the last "settle_days" days), so holes
+                         are downloaded again until they settle.
+        @param complete: If True, the whole interval is complete, even if
+                         it is recent (e.g. no value can be published in
+                         it).
+        '''
+        settle_date = date.today() - timedelta(days=self.settle_days)
+        if final_date > settle_date and not complete:
+            # Values may still be published for this interval, so it is
+            # only complete up to its last value.
+            final_date = max(values) if values else None
+
+            if calendar is not None and final_date is not None:
+                gap = calendar.first_gap(
+                    values, max(initial_date,
+                                settle_date + timedelta(days=1)),
+                    final_date)
+                if gap is not None:
+                    final_date = gap - timedelta(days=1)
+
+        with self.__lock:
+            self.__values.update(dict(((serie, qdate), qvalue)
+                                      for qdate, qvalue in values.items()))
+
+            if final_date is not None and final_date >= initial_date:
+                self.__add_span(serie, initial_date.toordinal(),
+                                final_date.toordinal())
+
+    def get(self, serie, initial_date, final_date):
+        '''
+        Get the values held by the cache in an interval of dates.
+        @param serie: The series number.
+        @return: A dictionary "date: quotation".
+        '''
+        with self.__lock:
+            return dict(self.__values.points(serie, initial_date,
+                                             final_date))
+
+    def last_date(self, serie):
+        '''
+        Get the date of the most recent value held for a series.
+        @return: A date or None if there are no values for the series.
+        '''
+        with self.__lock:
+            return self.__values.last_date(serie)
+
+    def store_probe(self, serie, last_date, periodicity):
+        '''
+        Store the result of probing a series for its most recent value.
+        @param serie: The series number.
+        @param last_date: Date of the most recent value published.
+        @param periodicity: Periodicity code of the series (e.g. 'D', 'M').
+        '''
+        with self.__lock:
+            self.__probes[serie] = (date.today(), last_date, periodicity)
+
+    def probe_info(self, serie):
+        '''
+        Get the result of the last probe of a series.
+        @return: A tuple "probe date, last date, periodicity" or None if
+                 the series was never probed.
+        '''
+        with self.__lock:
+            return self.__probes.get(serie)
+
+    def __add_span(self, serie, ini, end):
+        '''
+        Add a complete span to a series, merging it with the overlapping
+        and adjacent spans.
+        '''
+        merged = list()
+        for span_ini, span_end in self.__spans.get(serie, ()):
+            if span_end + 1 < ini or span_ini > end + 1:
+                merged.append([span_ini, span_end])
+            else:
+                ini = min(ini, span_ini)
+                end = max(end, span_end)
+
+        merged.append([ini, end])
+        merged.sort()
+        self.__spans[serie] = merged
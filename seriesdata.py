@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+
+
+NAN = float('nan')
+
+
+class SeriesData(object):
+    '''
+    Compact container of quotations of several symbols.
+
+    Instead of a dictionary "ticker, date: quotation", where every point
+    costs a tuple, a date and a float object, each symbol keeps two arrays
+    sorted by date: one with the date ordinals and one with the values
+    (float64).  Missing values (None) are stored as NaN.
+
+    The container offers the main operations of the dictionary it replaces
+    (len, in, [], items, update), always iterating in "ticker, date" order.
+    '''
+
+    __slots__ = ('__dates', '__values')
+
+    def __init__(self, values=None):
+        '''
+        Constructor
+        @param values: Initial values: a dictionary "ticker, date: quotation"
+                       or another SeriesData.
+        '''
+        self.__dates = dict()  # symbol: array of date ordinals
+        self.__values = dict()  # symbol: array of values
+
+        if values:
+            self.update(values)
+
+    def __getstate__(self):
+        return self.__dates, self.__values
+
+    def __setstate__(self, state):
+        self.__dates, self.__values = state
+
+    def __len__(self):
+        return sum(len(dates) for dates in self.__dates.values())
+
+    def __contains__(self, key):
+        return self.__find(*key) is not None
+
+    def __getitem__(self, key):
+        index = self.__find(*key)
+        if index is None:
+            raise KeyError(key)
+
+        return self.__unbox(self.__values[key[0]][index])
+
+    def __iter__(self):
+        for (symbol, qdate), _ in self.iteritems():
+            yield symbol, qdate
+
+    def symbols(self):
+        '''
+        @return: A sorted list with all symbols.
+        '''
+        return sorted(self.__dates)
+
+    def update(self, values):
+        '''
+        Merge values into the container, replacing the values of existing
+        dates.
+        @param values: A dictionary "ticker, date: quotation", another
+                       SeriesData or an iterable of pairs "(ticker, date),
+                       quotation" (like dict.update).
+        @return: Number of points added or changed.
+        '''
+        if isinstance(values, SeriesData):
+            items = values.iteritems()
+        elif hasattr(values, 'items'):
+            items = values.items()
+        else:
+            items = values
+
+        new_points = dict()  # symbol: {ordinal: value}
+        for (symbol, qdate), qvalue in items:
+            new_points.setdefault(symbol, dict())[qdate.toordinal()] = \
+                NAN if qvalue is None else qvalue
+
+        return sum(self.__merge(symbol, points)
+                   for symbol, points in new_points.items())
+
+    def iteritems(self):
+        '''
+        @return: A generator of pairs "(ticker, date), quotation" sorted by
+                 ticker and date.
+        '''
+        for symbol, qdate, qvalue in self.rows():
+            yield (symbol, qdate), qvalue
+
+    def items(self):
+        '''
+        @return: A list of pairs "(ticker, date), quotation" sorted by
+                 ticker and date.
+        '''
+        return list(self.iteritems())
+
+    def as_dict(self):
+        '''
+        @return: A dictionary "ticker, date: quotation" with all values.
+        '''
+        return dict(self.iteritems())
+
+    def rows(self, symbols=None):
+        '''
+        @param symbols: Symbols to include.  If None, all symbols.
+        @return: A generator of tuples "symbol, date, quotation" sorted by
+                 symbol and date.
+        '''
+        if symbols is None:
+            symbols = self.symbols()
+
+        for symbol in symbols:
+            for qdate, qvalue in self.points(symbol):
+                yield symbol, qdate, qvalue
+
+    def points(self, symbol, initial_date=None, final_date=None):
+        '''
+        Get the points of a symbol, optionally limited to an interval of
+        dates (found by binary search).
+        @return: A generator of tuples "date, quotation" sorted by date.
+        '''
+        dates = self.__dates.get(symbol, ())
+        values = self.__values.get(symbol, ())
+
+        begin = 0 if initial_date is None else \
+            bisect_left(dates, initial_date.toordinal())
+        end = len(dates) if final_date is None else \
+            bisect_right(dates, final_date.toordinal())
+
+        fromordinal = date.fromordinal
+        unbox = self.__unbox
+        for index in xrange(begin, end):
+            yield fromordinal(dates[index]), unbox(values[index])
+
+    def last_date(self, symbol):
+        '''
+        @return: The date of the last point of a symbol or None if there
+                 are no points.
+        '''
+        dates = self.__dates.get(symbol)
+        return date.fromordinal(dates[-1]) if dates else None
+
+    def __find(self, symbol, qdate):
+        '''
+        @return: The index of a date in the arrays of a symbol or None.
+        '''
+        dates = self.__dates.get(symbol)
+        if not dates:
+            return None
+
+        ordinal = qdate.toordinal()
+        index = bisect_left(dates, ordinal)
+        if index < len(dates) and dates[index] == ordinal:
+            return index
+        return None
+
+    def __merge(self, symbol, points):
+        '''
+        Merge points into the arrays of a symbol.
+        @param points: A dictionary "ordinal: value".
+        @return: Number of points added or changed.
+        '''
+        dates = self.__dates.get(symbol)
+        ordinals = sorted(points)
+
+        if not dates or ordinals[0] > dates[-1]:
+            # Usual case: new points after all existing ones
+            if not dates:
+                dates = self.__dates[symbol] = array('l')
+                self.__values[symbol] = array('d')
+            dates.extend(ordinals)
+            self.__values[symbol].extend(points[i] for i in ordinals)
+            return len(ordinals)
+
+        merged = dict(zip(dates, self.__values[symbol]))
+        changes = 0
+        for ordinal, qvalue in points.items():
+            old_value = merged.get(ordinal)
+            # NaN (missing value) is not equal to itself
+            if old_value is None or (old_value != qvalue and
+                                     (old_value == old_value or
+                                      qvalue == qvalue)):
+                changes += 1
+
+        if not changes:
+            return 0
+
+        merged.update(points)
+        ordinals = sorted(merged)
+        self.__dates[symbol] = array('l', ordinals)
+        self.__values[symbol] = array('d', (merged[i] for i in ordinals))
+
+        return changes
+
+    @staticmethod
+    def __unbox(qvalue):
+        # NaN is the only value not equal to itself
+        return None if qvalue != qvalue else qvalue